@@ -2,35 +2,65 @@ import json
 from typing import List
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
+from .resilience import CircuitBreaker, InvalidResponseError, ResilientCaller
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+_genai_module = None
 
 
-async def generate_recommendation_reasoning(prompt: str) -> str:
-    """
-    Wrapper using Gemini (Google Generative AI).
-    """
-    if not GEMINI_API_KEY:
-        # Fallback for offline dev
-        return "Offline simulation: recommendation based on RSI and momentum signals."
+def _genai():
+    """Import and configure the Gemini SDK on first use (it is slow to import)"""
+    global _genai_module
+    if _genai_module is None:
+        import google.generativeai as genai
 
-    try:
-        # Use the Gemini 2.5 Flash (fast) or 2.5 Pro (more accurate)
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        if GEMINI_API_KEY:
+            genai.configure(api_key=GEMINI_API_KEY)
+        _genai_module = genai
+    return _genai_module
 
-        # Call the model
-        response = model.generate_content(prompt)
 
-        # Return plain text reasoning
-        return response.text.strip()
-    except Exception as e:
-        return f"Gemini error: {str(e)}"
+_hedge_percentile = os.getenv("GEMINI_HEDGE_PERCENTILE")
+
+# Every Gemini call goes through this: deadlines, retries, breaker, hedging
+gemini = ResilientCaller(
+    "gemini",
+    timeout=float(os.getenv("GEMINI_TIMEOUT_SECONDS", "20")),
+    # Caps attempts plus backoff, so one call never holds a request longer
+    deadline=float(os.getenv("GEMINI_CALL_DEADLINE_SECONDS", "30")),
+    max_attempts=int(os.getenv("GEMINI_MAX_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8")),
+    hedge_percentile=float(_hedge_percentile) if _hedge_percentile else None,
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30")),
+    ),
+)
+
+
+async def _generate_text(prompt: str) -> str:
+    model = _genai().GenerativeModel(GEMINI_MODEL)
+    response = await model.generate_content_async(prompt)
+    return response.text.strip()
+
+
+async def _generate_json(prompt: str) -> dict:
+    text = await _generate_text(prompt)
+    data = safe_parse_json(text)
+    if isinstance(data, dict) and "error" in data:
+        # Malformed output is usually transient, let the caller retry it
+        raise InvalidResponseError(data["error"])
+    return data
+
+
+def resilience_stats() -> dict:
+    """Breaker state and counters for the Gemini client"""
+    return gemini.stats()
 
 
 def safe_parse_json(text: str):
@@ -89,49 +119,43 @@ async def fetch_market_snapshot() -> dict:
     """
 
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        return safe_parse_json(response.text)
+        return await gemini.call(
+            lambda: _generate_json(prompt), cache_key="market_snapshot"
+        )
     except Exception as e:
         return {"error": f"Gemini error: {str(e)}"}
 
 
-async def fetch_stock_recommendations() -> dict:
+async def fetch_recommendation_narratives(picks: List[dict]) -> dict:
     """
-    Fetch stock-specific recommendations with technical indicators
-    """
-    if not GEMINI_API_KEY:
-        return {"error": "Gemini API key not set"}
-
-    prompt = """
-    You are a financial AI assistant.  
-    Generate plausible 5 stock recommendations for Indian equities.  
-    Return ONLY valid JSON.  
-
-    Schema:
-    {
-    "stocks": [
-        {
-        "ticker": "string (e.g., INFY, TCS, HDFCBANK)",
-        "company_name": "string",
-        "sector": "string",
-        "current_price": float,
-        "target_price": float,
-        "recommendation": "BUY" | "SELL" | "HOLD",
-        "confidence_score": float (0-1),
-        "timeframe": "string (e.g., '1-3 Months', '1-2 Weeks')",
-        "reasons": "short explanation why recommendation is made"
-        }
-    ]
-    }
+    Ask Gemini to phrase the `reasons` text for picks that were already
+    ranked locally. Returns {ticker: reason}; empty dict on any failure so
+    callers can fall back to the signal summary.
     """
+    if not GEMINI_API_KEY or not picks:
+        return {}
+
+    lines = "\n".join(
+        f"- {p['ticker']} ({p['sector']}): {p['recommendation']}, "
+        f"price {p['current_price']}, target {p['target_price']}, "
+        f"timeframe {p['timeframe']}, signals {json.dumps(p['signals'])}"
+        for p in picks
+    )
+    prompt = (
+        "You are a financial AI assistant.\n"
+        "Each line below is a stock call already decided by a quantitative model.\n"
+        "Do NOT change the calls or numbers. For each ticker write one or two "
+        "sentences explaining the call from the given signals.\n"
+        'Return ONLY valid JSON of the form {"reasons": {"TICKER": "text"}}.\n\n'
+        + lines
+    )
 
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        return safe_parse_json(response.text)
-    except Exception as e:
-        return {"error": f"Gemini error: {str(e)}"}
+        data = await gemini.call(lambda: _generate_json(prompt))
+    except Exception:
+        return {}
+    reasons = data.get("reasons") if isinstance(data, dict) else None
+    return reasons if isinstance(reasons, dict) else {}
 
 
 async def fetch_stock_prices(tickers: List[str]) -> dict:
@@ -160,12 +184,13 @@ async def fetch_stock_prices(tickers: List[str]) -> dict:
 
     3. Do not include explanations, markdown, or additional commentary — only the JSON output.
 
-    Now, return the updated stock prices for the following tickers: {tickers}
-    """
+    Now, return the updated stock prices for the following tickers: 
+    """ + ", ".join(tickers)
 
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        return safe_parse_json(response.text)
+        return await gemini.call(
+            lambda: _generate_json(prompt),
+            cache_key="stock_prices:" + ",".join(sorted(tickers)),
+        )
     except Exception as e:
         return {"error": f"Gemini error: {str(e)}"}
@@ -0,0 +1,318 @@
+# app/alerts.py
+"""
+Price alerts: "notify me when RELIANCE crosses 2500".
+
+Armed alerts are held in memory per ticker as two sorted threshold lists
+("above" and "below"). A tick from old -> new bisects the interval
+between the two prices, so each tick costs O(log n + triggered) however
+many alerts exist. Triggered alerts are claimed with one UPDATE ...
+RETURNING (a concurrent evaluation can't fire them twice) and their
+notifications are written in one bulk INSERT.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, Integer, column, insert, select, update, values
+
+from app.coordination import publish
+
+from .models import NotificationHistory, PriceAlert, Stock, StockPrice
+
+DIRECTIONS = ("above", "below")
+
+
+class PriceAlertIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        # ticker -> last price seen, the "old" end of the next tick
+        self.last: Dict[str, float] = {}
+        # ticker -> direction -> (sorted thresholds, alert ids in the same order)
+        self.alerts: Dict[str, Dict[str, Tuple[list, list]]] = {}
+
+    def load(self, db):
+        rows = db.execute(
+            select(
+                PriceAlert.id,
+                PriceAlert.ticker,
+                PriceAlert.threshold,
+                PriceAlert.direction,
+            ).where(PriceAlert.is_active)
+        ).all()
+        tickers = {r.ticker for r in rows}
+        last = (
+            dict(
+                db.execute(
+                    select(StockPrice.ticker, StockPrice.close)
+                    .where(StockPrice.ticker.in_(tickers))
+                    .distinct(StockPrice.ticker)
+                    .order_by(StockPrice.ticker, StockPrice.price_date.desc())
+                ).all()
+            )
+            if tickers
+            else {}
+        )
+        with self.lock:
+            self.alerts = {}
+            for r in sorted(rows, key=lambda r: r.threshold):
+                thresholds, ids = self._side(r.ticker, r.direction)
+                thresholds.append(r.threshold)
+                ids.append(r.id)
+            self.last = last
+            self.loaded = True
+
+    def invalidate(self):
+        """Drop the index; the next ensure_loaded() rebuilds it"""
+        with self.lock:
+            self.loaded = False
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    def _side(self, ticker: str, direction: str) -> Tuple[list, list]:
+        sides = self.alerts.setdefault(ticker, {d: ([], []) for d in DIRECTIONS})
+        return sides[direction]
+
+    # --- maintenance ---
+
+    def add(self, alert_id: int, ticker: str, threshold: float, direction: str):
+        with self.lock:
+            if not self.loaded:
+                return  # picked up by the next load
+            thresholds, ids = self._side(ticker, direction)
+            i = bisect_right(thresholds, threshold)
+            thresholds.insert(i, threshold)
+            ids.insert(i, alert_id)
+
+    def remove(self, alert_id: int, ticker: str, threshold: float, direction: str):
+        with self.lock:
+            if ticker not in self.alerts:
+                return
+            thresholds, ids = self._side(ticker, direction)
+            i = bisect_left(thresholds, threshold)
+            while i < len(thresholds) and thresholds[i] == threshold:
+                if ids[i] == alert_id:
+                    del thresholds[i], ids[i]
+                    return
+                i += 1
+
+    def tickers(self) -> set:
+        with self.lock:
+            return {
+                t
+                for t, sides in self.alerts.items()
+                if any(s[0] for s in sides.values())
+            }
+
+    def last_price(self, ticker: str) -> Optional[float]:
+        with self.lock:
+            return self.last.get(ticker)
+
+    # --- evaluation ---
+
+    def crossed(self, prices: Dict[str, float]) -> List[tuple]:
+        """
+        (alert_id, ticker, direction, threshold, price) for every alert
+        crossed by these ticks. Read-only: the index only moves on in
+        settle(), once the triggering transaction has committed. The first
+        tick of a ticker with no known previous price matches nothing.
+        """
+        hits = []
+        with self.lock:
+            for ticker, new in prices.items():
+                old = self.last.get(ticker)
+                sides = self.alerts.get(ticker)
+                if old is None or sides is None or new == old:
+                    continue
+                if new > old:
+                    # Thresholds in (old, new]
+                    direction = "above"
+                    thresholds, ids = sides[direction]
+                    lo = bisect_right(thresholds, old)
+                    hi = bisect_right(thresholds, new)
+                else:
+                    # Thresholds in [new, old)
+                    direction = "below"
+                    thresholds, ids = sides[direction]
+                    lo = bisect_left(thresholds, new)
+                    hi = bisect_left(thresholds, old)
+                hits.extend(
+                    (ids[i], ticker, direction, thresholds[i], new)
+                    for i in range(lo, hi)
+                )
+        return hits
+
+    def on_prices_updated(self, data: dict):
+        """
+        Another worker's refresh: move `last` on to its prices. Alerts it
+        fired arrive separately as price_alerts_changed. Rebuild only when
+        the prices didn't fit in the notification.
+        """
+        prices = data.get("prices")
+        if prices is None:
+            self.invalidate()
+        else:
+            self.settle(prices, [])
+
+    def settle(self, prices: Dict[str, float], hits: List[tuple]):
+        """After commit: record the new prices and drop the crossed alerts"""
+        with self.lock:
+            self.last.update(prices)
+        for alert_id, ticker, direction, threshold, _ in hits:
+            self.remove(alert_id, ticker, threshold, direction)
+
+
+price_alerts = PriceAlertIndex()
+
+
+def evaluate_ticks(db, prices: Dict[str, float]) -> List[tuple]:
+    """
+    Fire every alert crossed by this batch of prices, on the caller's
+    transaction. Returns the crossed alerts; after committing, the caller
+    passes them to price_alerts.settle(prices, hits). On rollback the
+    index is untouched, so the same alerts are matched again next tick.
+    """
+    price_alerts.ensure_loaded(db)
+    hits = price_alerts.crossed(prices)
+    if not hits:
+        return hits
+
+    crossed = values(
+        column("id", Integer), column("price", Float), name="crossed"
+    ).data([(alert_id, price) for alert_id, *_, price in hits])
+    today = date.today()
+    fired = db.execute(
+        update(PriceAlert)
+        .where(PriceAlert.id == crossed.c.id, PriceAlert.is_active)
+        .values(is_active=False, triggered_at=today, triggered_price=crossed.c.price)
+        .returning(
+            PriceAlert.user_id,
+            PriceAlert.ticker,
+            PriceAlert.threshold,
+            PriceAlert.direction,
+            PriceAlert.triggered_price,
+        )
+    ).all()
+    if not fired:
+        return hits
+
+    db.execute(
+        insert(NotificationHistory),
+        [
+            {
+                "user_id": r.user_id,
+                "notification_type": "price_alert",
+                "title": f"{r.ticker} crossed {r.threshold:g}",
+                "message": (
+                    f"{r.ticker} is at {r.triggered_price:.2f}, "
+                    f"{r.direction} your alert level of {r.threshold:g}."
+                ),
+                "ticker": r.ticker,
+                "sent_at": today,
+                "created_at": today,
+            }
+            for r in fired
+        ],
+    )
+    publish(db, "price_alerts_changed", {"triggered": len(fired)})
+    return hits
+
+
+# --- alert rules ---
+
+
+def _current_price(db, ticker: str) -> Optional[float]:
+    price = price_alerts.last_price(ticker)
+    if price is not None:
+        return price
+    price = db.execute(
+        select(StockPrice.close)
+        .where(StockPrice.ticker == ticker)
+        .order_by(StockPrice.price_date.desc())
+        .limit(1)
+    ).scalar()
+    if price is None:
+        price = db.execute(
+            select(Stock.current_price)
+            .where(Stock.ticker == ticker, Stock.current_price.is_not(None))
+            .limit(1)
+        ).scalar()
+    return price
+
+
+def create_alert(
+    db, user_id: str, ticker: str, threshold: float, direction: Optional[str] = None
+) -> dict:
+    """
+    Insert an armed alert; direction defaults to the side of the current
+    price the threshold is on. Raises ValueError when it can't be inferred.
+    The caller commits, then calls price_alerts.add(...).
+    """
+    ticker = ticker.strip().upper()
+    if direction is None:
+        price = _current_price(db, ticker)
+        if price is None:
+            raise ValueError(f"no price for {ticker}; pass direction explicitly")
+        direction = "above" if threshold > price else "below"
+    alert_id = db.execute(
+        insert(PriceAlert)
+        .values(
+            user_id=user_id,
+            ticker=ticker,
+            threshold=threshold,
+            direction=direction,
+            is_active=True,
+            created_at=date.today(),
+        )
+        .returning(PriceAlert.id)
+    ).scalar_one()
+    publish(db, "price_alerts_changed", {"created": alert_id})
+    return {
+        "alert_id": alert_id,
+        "ticker": ticker,
+        "threshold": threshold,
+        "direction": direction,
+    }
+
+
+def cancel_alert(db, user_id: str, alert_id: int) -> Optional[dict]:
+    """Disarm one of the user's alerts; None if it isn't armed"""
+    row = db.execute(
+        update(PriceAlert)
+        .where(
+            PriceAlert.id == alert_id,
+            PriceAlert.user_id == user_id,
+            PriceAlert.is_active,
+        )
+        .values(is_active=False)
+        .returning(PriceAlert.ticker, PriceAlert.threshold, PriceAlert.direction)
+    ).first()
+    if row is None:
+        return None
+    publish(db, "price_alerts_changed", {"cancelled": alert_id})
+    return {"alert_id": alert_id, **row._asdict()}
+
+
+def list_alerts(db, user_id: str, active: Optional[bool] = None) -> list:
+    a = PriceAlert
+    q = (
+        select(
+            a.id,
+            a.ticker,
+            a.threshold,
+            a.direction,
+            a.is_active,
+            a.triggered_at,
+            a.triggered_price,
+            a.created_at,
+        )
+        .where(a.user_id == user_id)
+        .order_by(a.id.desc())
+    )
+    if active is not None:
+        q = q.where(a.is_active.is_(active))
+    return [dict(r._mapping) for r in db.execute(q)]
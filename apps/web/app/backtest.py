@@ -0,0 +1,271 @@
+# app/backtest.py
+"""
+Backtest stored StockRecommendation rows (including archived ones)
+against the stock_prices history.
+
+Per ticker, every recommendation is evaluated at once with array
+operations over a (recommendations x horizon) price window. Tickers are
+spread across a process pool; results are cached until either table
+changes.
+"""
+
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, union_all
+
+from .coordination import stored_versions
+from .models import StockPrice, StockRecommendation, archive_tables
+from .recommender import timeframe_days
+
+# HOLD counts as a hit if the price stays within this band over the horizon
+HOLD_BAND = 0.03
+# Below this many tickers the pool costs more than it saves
+POOL_MIN_TICKERS = 32
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "0")) or None
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Never fork: this process runs listener/retention/bootstrap threads
+            _pool = ProcessPoolExecutor(
+                max_workers=BACKTEST_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _backtest_ticker(job: tuple) -> dict:
+    """
+    Evaluate all recommendations of one ticker.
+    job = (price_days, closes, rec_days, entry_prices, targets, directions, horizons)
+    Days are date ordinals; direction is +1 BUY, -1 SELL, 0 HOLD.
+    """
+    price_days, closes, rec_days, entry, target, direction, horizon = job
+    n_prices = len(closes)
+    n = len(rec_days)
+    out = {
+        "evaluated": np.zeros(n, dtype=bool),
+        "matured": np.zeros(n, dtype=bool),
+        "hit": np.zeros(n, dtype=bool),
+        "days_to_target": np.full(n, np.nan),
+        "return_pct": np.full(n, np.nan),
+        "drawdown_pct": np.full(n, np.nan),
+    }
+    if n_prices == 0 or n == 0:
+        return out
+
+    # First trading day strictly after the recommendation
+    start = np.searchsorted(price_days, rec_days, side="right")
+    evaluated = (start < n_prices) & np.isfinite(entry) & (entry > 0)
+    width = int(horizon.max())
+    steps = np.arange(width)
+    idx = start[:, None] + steps[None, :]
+    in_window = (steps[None, :] < horizon[:, None]) & (idx < n_prices)
+    path = np.where(in_window, closes[np.minimum(idx, n_prices - 1)], np.nan)
+
+    # Unevaluated rows are all-NaN windows; they are masked out below
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        rel = path / entry[:, None] - 1
+        side = np.where(direction == 0, 1.0, direction)[:, None]
+        excursion = side * rel
+
+        buy_hit = (direction[:, None] > 0) & (path >= target[:, None])
+        sell_hit = (direction[:, None] < 0) & (path <= target[:, None])
+        hold_ok = np.abs(rel) <= HOLD_BAND
+        touched = buy_hit | sell_hit
+        hit_dir = touched.any(axis=1)
+        hold_hit = (direction == 0) & np.all(hold_ok | ~in_window, axis=1)
+
+        last_pos = np.maximum(in_window.sum(axis=1) - 1, 0)
+        final_rel = rel[np.arange(n), last_pos]
+
+        out["evaluated"] = evaluated
+        out["matured"] = evaluated & (start + horizon <= n_prices)
+        out["hit"] = evaluated & np.where(direction == 0, hold_hit, hit_dir)
+        out["days_to_target"] = np.where(
+            evaluated & hit_dir, touched.argmax(axis=1) + 1.0, np.nan
+        )
+        # HOLD keeps side=+1, so this is the raw move for HOLD calls
+        out["return_pct"] = np.where(evaluated, side[:, 0] * final_rel, np.nan) * 100
+        out["drawdown_pct"] = (
+            np.where(evaluated, np.minimum(np.nanmin(excursion, axis=1), 0.0), np.nan)
+            * 100
+        )
+    return out
+
+
+def _recs_query(table, start: Optional[date], end: Optional[date]):
+    c = table.c
+    q = select(
+        c.id,
+        c.ticker,
+        c.sector,
+        c.recommendation,
+        c.current_price,
+        c.target_price,
+        c.timeframe,
+        c.alert_time,
+        c.analysis_type,
+        c.recommendation_date,
+    ).where(c.recommendation_date.is_not(None))
+    if start:
+        q = q.where(c.recommendation_date >= start)
+    if end:
+        q = q.where(c.recommendation_date <= end)
+    return q
+
+
+def _load(db, start: Optional[date], end: Optional[date]) -> pd.DataFrame:
+    # Recommendations moved out by the retention job still count
+    q = union_all(
+        _recs_query(StockRecommendation.__table__, start, end),
+        _recs_query(archive_tables[StockRecommendation.__tablename__], start, end),
+    )
+    recs = pd.DataFrame(
+        db.execute(q).all(), columns=[c.name for c in q.selected_columns]
+    )
+    if recs.empty:
+        return recs
+    recs["ticker"] = recs["ticker"].str.upper()
+    recs["sector"] = recs["sector"].fillna("Unknown").str.strip()
+    recs["alert_time"] = recs["alert_time"].fillna("Unknown")
+    recs["strategy"] = (
+        recs["analysis_type"]
+        .fillna(recs["alert_time"].map({"10_AM": "momentum", "2_PM": "swing"}))
+        .fillna("unknown")
+    )
+    return recs
+
+
+def _run(db, recs: pd.DataFrame) -> pd.DataFrame:
+    first_day = recs["recommendation_date"].min()
+    prices = pd.DataFrame(
+        db.execute(
+            select(StockPrice.ticker, StockPrice.price_date, StockPrice.close)
+            .where(
+                func.upper(StockPrice.ticker).in_(recs["ticker"].unique().tolist()),
+                StockPrice.price_date > first_day,
+            )
+            .order_by(StockPrice.ticker, StockPrice.price_date)
+        ).all(),
+        columns=["ticker", "price_date", "close"],
+    )
+    prices["ticker"] = prices["ticker"].str.upper()
+    prices["day"] = prices["price_date"].map(date.toordinal)
+    price_groups = {t: g for t, g in prices.groupby("ticker", sort=False)}
+
+    recs = recs.copy()
+    recs["day"] = recs["recommendation_date"].map(date.toordinal)
+    call = recs["recommendation"].fillna("HOLD").str.upper()
+    recs["direction"] = np.select([call == "BUY", call == "SELL"], [1.0, -1.0], 0.0)
+    recs["horizon"] = recs["timeframe"].map(timeframe_days).astype(np.int64)
+
+    groups, jobs = [], []
+    for ticker, g in recs.groupby("ticker", sort=False):
+        p = price_groups.get(ticker)
+        groups.append(g)
+        jobs.append(
+            (
+                p["day"].to_numpy(np.int64) if p is not None else np.empty(0, np.int64),
+                p["close"].to_numpy(float) if p is not None else np.empty(0),
+                g["day"].to_numpy(np.int64),
+                g["current_price"].to_numpy(float),
+                g["target_price"].to_numpy(float),
+                g["direction"].to_numpy(float),
+                g["horizon"].to_numpy(np.int64),
+            )
+        )
+
+    if len(jobs) >= POOL_MIN_TICKERS:
+        results = list(_get_pool().map(_backtest_ticker, jobs, chunksize=8))
+    else:
+        results = [_backtest_ticker(j) for j in jobs]
+
+    return pd.concat(
+        [g.assign(**res) for g, res in zip(groups, results)], ignore_index=True
+    )
+
+
+def _summarize(df: pd.DataFrame, by: Optional[str] = None):
+    df = df[df["evaluated"]]
+
+    def metrics(g: pd.DataFrame) -> dict:
+        return {
+            "evaluated": int(len(g)),
+            "matured": int(g["matured"].sum()),
+            # Only matured calls are decided; open ones aren't misses yet
+            "hit_rate": (
+                round(float(g.loc[g["matured"], "hit"].mean()) * 100, 2)
+                if g["matured"].any()
+                else None
+            ),
+            "avg_days_to_target": _round(g["days_to_target"].mean()),
+            "avg_return_pct": _round(g["return_pct"].mean()),
+            "median_return_pct": _round(g["return_pct"].median()),
+            "avg_drawdown_pct": _round(g["drawdown_pct"].mean()),
+            "max_drawdown_pct": _round(g["drawdown_pct"].min()),
+        }
+
+    if by is None:
+        return metrics(df)
+    return [{by: key, **metrics(g)} for key, g in df.groupby(by, sort=True)]
+
+
+def _round(value, digits=2):
+    return round(float(value), digits) if pd.notna(value) else None
+
+
+def _data_version(db) -> tuple:
+    # Bumped by every write to either table or the recommendations archive
+    return stored_versions(db, "stock_recommendations", "stock_prices")
+
+
+def backtest_summary(db, start: Optional[date] = None, end: Optional[date] = None):
+    """
+    Hit rate, time-to-target, returns and drawdown overall and per
+    strategy / alert_time / sector. Cached until recommendations or
+    prices change.
+    """
+    key = (start, end, _data_version(db))
+    if key in _cache:
+        return _cache[key]
+
+    recs = _load(db, start, end)
+    if recs.empty:
+        result = {
+            "total": 0,
+            "overall": None,
+            "by_strategy": [],
+            "by_alert_time": [],
+            "by_sector": [],
+        }
+    else:
+        df = _run(db, recs)
+        result = {
+            "total": int(len(df)),
+            "overall": _summarize(df),
+            "by_strategy": _summarize(df, "strategy"),
+            "by_alert_time": _summarize(df, "alert_time"),
+            "by_sector": _summarize(df, "sector"),
+        }
+
+    # Only the latest data version is worth keeping
+    for stale in [k for k in _cache if k[2] != key[2]]:
+        _cache.pop(stale, None)
+    _cache[key] = result
+    return result
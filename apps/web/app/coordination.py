@@ -0,0 +1,229 @@
+# app/coordination.py
+"""
+Cross-worker coordination over Postgres.
+
+- advisory_lock(): serialize one-off work (startup bootstrap) across
+  every worker on every host
+- run_exclusive(): run a scheduled job in at most one worker at a time,
+  and at most once per interval across all of them
+- publish()/subscribe(): LISTEN/NOTIFY broadcast of data-version changes
+  so per-process caches are invalidated everywhere
+- bump_version()/stored_versions(): persistent per-table write counters
+  for caches that must survive restarts
+"""
+
+import json
+import os
+import select as io_select
+import socket
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event as sa_event
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.models import DataVersion, JobRun
+
+CHANNEL = os.getenv("COORDINATION_CHANNEL", "invest_ai_events")
+# Identifies this process so it can skip its own broadcasts
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+_subscribers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+_versions: Dict[str, int] = defaultdict(int)
+_versions_lock = threading.Lock()
+_listener = None
+# NOTIFY rejects payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+# Session.info key for events published on a not-yet-committed transaction
+_PENDING = "coordination_published"
+
+
+def lock_key(name: str) -> int:
+    """Stable bigint key for pg_advisory_lock from a readable name"""
+    return zlib.crc32(name.encode())
+
+
+@contextmanager
+def advisory_lock(name: str):
+    """Block until this process holds the named session-level lock"""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": lock_key(name)})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": lock_key(name)})
+            conn.commit()
+
+
+def run_exclusive(
+    name: str, fn: Callable, *args, every: Optional[float] = None, **kwargs
+) -> bool:
+    """
+    Run fn only if no other worker is running the job `name` right now
+    (pg_try_advisory_lock: never waits) and, when `every` seconds is
+    given, no worker completed it within that interval. Returns False
+    when the job was skipped.
+    """
+    with engine.connect() as conn:
+        got = conn.execute(
+            text("SELECT pg_try_advisory_lock(:k)"), {"k": lock_key(name)}
+        ).scalar()
+        conn.commit()
+        if not got:
+            return False
+        try:
+            if every is not None:
+                recent = conn.execute(
+                    select(JobRun.name).where(
+                        JobRun.name == name,
+                        JobRun.last_run_at > func.now() - timedelta(seconds=every),
+                    )
+                ).first()
+                conn.commit()
+                if recent:
+                    return False
+            fn(*args, **kwargs)
+            stmt = pg_insert(JobRun).values(name=name, last_run_at=func.now())
+            conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[JobRun.name],
+                    set_={"last_run_at": stmt.excluded.last_run_at},
+                )
+            )
+            conn.commit()
+            return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": lock_key(name)})
+            conn.commit()
+
+
+def publish(db, event: str, data: dict = None):
+    """
+    Queue a notification on the caller's transaction; Postgres delivers it
+    to every listening worker only if and when that transaction commits.
+    The local version counts it at the same point (see _count_on_commit).
+    Data that would push the payload past the NOTIFY limit is dropped and
+    the event is sent with {"truncated": true}; handlers then reload.
+    """
+    payload = json.dumps({"event": event, "origin": ORIGIN, "data": data or {}})
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        payload = json.dumps(
+            {"event": event, "origin": ORIGIN, "data": {"truncated": True}}
+        )
+    db.execute(text("SELECT pg_notify(:c, :p)"), {"c": CHANNEL, "p": payload})
+    db.info.setdefault(_PENDING, []).append(event)
+
+
+def _count(events):
+    with _versions_lock:
+        for event in events:
+            _versions[event] += 1
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _count_on_commit(session):
+    _count(session.info.pop(_PENDING, ()))
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _drop_on_rollback(session):
+    session.info.pop(_PENDING, None)
+
+
+def bump_version(db, name: str):
+    """Increment a table's write counter on the caller's transaction"""
+    stmt = pg_insert(DataVersion).values(name=name, version=1)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DataVersion.name],
+            set_={"version": DataVersion.version + 1},
+        )
+    )
+
+
+def stored_versions(db, *names: str) -> tuple:
+    """Write counters for the named tables, 0 for ones never bumped"""
+    rows = dict(
+        db.execute(
+            select(DataVersion.name, DataVersion.version).where(
+                DataVersion.name.in_(names)
+            )
+        ).all()
+    )
+    return tuple(rows.get(name, 0) for name in names)
+
+
+def subscribe(event: str, callback: Callable[[dict], None]):
+    """callback(data) runs in the listener thread for events from other workers"""
+    _subscribers[event].append(callback)
+
+
+def data_versions() -> dict:
+    """Events seen by this process (published or received), by name"""
+    with _versions_lock:
+        return dict(_versions)
+
+
+def _dispatch(raw: str):
+    try:
+        msg = json.loads(raw)
+    except json.JSONDecodeError:
+        return
+    event = msg.get("event")
+    if not event or msg.get("origin") == ORIGIN:
+        return
+    _count([event])
+    for callback in _subscribers.get(event, []):
+        try:
+            callback(msg.get("data") or {})
+        except Exception as e:
+            print(f"❌ Handler for {event} failed: {e}")
+
+
+def _listen_forever():
+    delay = 1.0
+    while True:
+        conn = None
+        try:
+            conn = engine.raw_connection()
+            driver = conn.driver_connection
+            driver.autocommit = True
+            cur = driver.cursor()
+            cur.execute(f'LISTEN "{CHANNEL}"')
+            delay = 1.0
+            while True:
+                if io_select.select([driver], [], [], 30) == ([], [], []):
+                    continue
+                driver.poll()
+                while driver.notifies:
+                    _dispatch(driver.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"⚠️ Coordination listener error: {e}; reconnecting in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+        finally:
+            if conn is not None:
+                # Never hand a LISTENing autocommit connection back to the pool
+                try:
+                    conn.invalidate()
+                except Exception:
+                    pass
+
+
+def start_listener():
+    """Start the LISTEN thread once per process"""
+    global _listener
+    if _listener is None:
+        _listener = threading.Thread(
+            target=_listen_forever, name="coordination-listener", daemon=True
+        )
+        _listener.start()
@@ -1,10 +1,40 @@
 # app/data_loader.py
+"""
+Seed tables from DATA_DIR with Postgres COPY (Postgres only).
+
+A file whose checksum is already in seed_manifest is skipped. With
+SEED_RELOAD_CHANGED a changed file is merged, never truncated: rows are
+matched on a natural key, reference rows are updated, and history and
+user-owned rows are only added when missing, so data written by users
+and the app survives a reload.
+"""
+
+import csv
+import hashlib
+import io
 import json
 import os
-from app.database import SessionLocal
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sqlalchemy import Column, MetaData, Table, and_, exists, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.coordination import bump_version
+from app.database import engine
 from app import models
+from app.portfolio import rebuild_summaries
 
-DATA_DIR = "./data"
+# Resolved from this file, not the working directory
+DATA_DIR = os.getenv(
+    "DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"),
+)
+BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "50000"))
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", "4"))
+# Merge a changed seed file into its table (see module docstring)
+RELOAD_CHANGED = os.getenv("SEED_RELOAD_CHANGED", "").lower() in ("1", "true", "yes")
 
 TABLE_FILE_MODEL_MAP = {
     "nifty_indices.json": models.NiftyIndex,
@@ -17,42 +47,277 @@ TABLE_FILE_MODEL_MAP = {
     "notification_history.json": models.NotificationHistory,
 }
 
+# Natural key per table for reloads, and whether matching rows take the
+# seed values; otherwise existing rows (user data, app history) are kept
+MERGE_KEYS = {
+    "nifty_indices": (("name",), True),
+    "stocks": (("user_id", "ticker"), True),
+    "stock_recommendations": (("ticker", "alert_time", "recommendation_date"), False),
+    "market_analysis": (("analysis_date", "created_at"), False),
+    "technical_indicators": (("ticker", "analysis_date"), False),
+    "sector_performance": (("sector_name", "analysis_date"), False),
+    "user_preferences": (("user_id",), False),
+    "notification_history": (("user_id", "title", "sent_at"), False),
+}
+
+_SEPARATORS = re.compile(r"[\s,]*")
+
+# NDJSON variants are picked up in preference to the JSON array file
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+
+def _resolve(filename: str):
+    stem = os.path.splitext(filename)[0]
+    for suffix in NDJSON_SUFFIXES + (".json",):
+        path = os.path.join(DATA_DIR, stem + suffix)
+        if os.path.exists(path):
+            return path
+    return None
 
-def load_initial_data():
-    db = SessionLocal()
-
-    for filename, model in TABLE_FILE_MODEL_MAP.items():
-        filepath = os.path.join(DATA_DIR, filename)
-        if not os.path.exists(filepath):
-            print(f"⚠️ Skipping {filename}, not found")
-            continue
-
-        # Skip if table already has data
-        count = db.query(model).count()
-        if count > 0:
-            print(
-                f"ℹ️ Skipping {filename}, {count} records already in {model.__tablename__}"
-            )
-            continue
 
-        with open(filepath, "r") as f:
+def _checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_records(path: str, chunk_size: int = 1 << 20):
+    """
+    Yield records from an NDJSON file or a top-level JSON array without
+    loading the whole file. Every record must be a JSON object: a scalar
+    that ends at a chunk boundary would otherwise decode as a prefix of
+    itself.
+    """
+
+    def record(obj):
+        if not isinstance(obj, dict):
+            raise ValueError(f"expected JSON objects, got {type(obj).__name__}")
+        return obj
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(NDJSON_SUFFIXES):
+            for line in f:
+                if line.strip():
+                    yield record(json.loads(line))
+            return
+
+        decoder = json.JSONDecoder()
+        buf, pos, eof = "", 0, False
+
+        def refill():
+            nonlocal buf, pos, eof
+            more = f.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+
+        refill()
+        pos = _SEPARATORS.match(buf, pos).end()
+        if buf[pos : pos + 1] != "[":
+            raise ValueError("expected a JSON array")
+        pos += 1
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError("unterminated JSON array")
+                refill()
+                continue
+            if buf[pos] == "]":
+                return
             try:
-                records = json.load(f)
-            except Exception as e:
-                print(f"❌ Error loading {filename}: {e}")
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Record split across chunks: pull in more and retry
+                if eof:
+                    raise
+                refill()
                 continue
+            yield record(obj)
 
-        if not isinstance(records, list):
-            print(f"⚠️ {filename} is not a list, skipping.")
-            continue
 
-        for record in records:
-            try:
-                db.add(model(**record))
-            except Exception as e:
-                print(f"❌ Error inserting record into {model.__tablename__}: {e}")
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-        db.commit()
-        print(f"✅ Imported {len(records)} records into {model.__tablename__}")
 
-    db.close()
+def _present_keys(path: str) -> set:
+    """Every key used by any record of the file (one streaming pass)"""
+    keys = set()
+    for r in iter_records(path):
+        keys.update(r)
+    return keys
+
+
+def _columns(table, present: set):
+    """Columns present in the data, plus any with a Python-side default"""
+    return [
+        c
+        for c in table.columns
+        if c.name in present
+        or (c.default is not None and c.default.is_scalar and not c.primary_key)
+    ]
+
+
+def _row(record, columns):
+    out = []
+    for c in columns:
+        value = record.get(c.name)
+        if value is None and c.default is not None and c.default.is_scalar:
+            value = c.default.arg
+        out.append(value)
+    return out
+
+
+def _copy_batch(conn, table, columns, batch):
+    """Postgres COPY FROM STDIN of one batch"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for values in (_row(r, columns) for r in batch):
+        writer.writerow(
+            [
+                (
+                    r"\N"
+                    if v is None
+                    else (
+                        json.dumps(v)
+                        if isinstance(v, (dict, list))
+                        else ("true" if v is True else "false" if v is False else v)
+                    )
+                )
+                for v in values
+            ]
+        )
+    buf.seek(0)
+    cols = ", ".join(f'"{c.name}"' for c in columns)
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY \"{table.name}\" ({cols}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buf,
+        )
+    finally:
+        cursor.close()
+
+
+def _merge_staged(conn, table, stage, columns):
+    """Update / insert-if-missing from the staging table on the natural key"""
+    keys, update_existing = MERGE_KEYS[table.name]
+    match = and_(*(table.c[k].is_not_distinct_from(stage.c[k]) for k in keys))
+    names = [c.name for c in columns]
+    updatable = [n for n in names if n not in keys]
+    updated = 0
+    if update_existing and updatable:
+        updated = conn.execute(
+            update(table).where(match).values({n: stage.c[n] for n in updatable})
+        ).rowcount
+    inserted = conn.execute(
+        table.insert().from_select(
+            names,
+            select(*(stage.c[n] for n in names)).where(
+                ~exists(select(1).select_from(table).where(match))
+            ),
+        )
+    ).rowcount
+    return updated, inserted
+
+
+def _load_file(filename: str, model) -> str:
+    table = model.__table__
+    path = _resolve(filename)
+    if not path:
+        return f"⚠️ Skipping {filename}, not found"
+
+    checksum = _checksum(path)
+    manifest = models.SeedManifest.__table__
+    with engine.begin() as conn:
+        entry = conn.execute(
+            select(manifest.c.checksum).where(manifest.c.filename == filename)
+        ).first()
+        if entry and entry.checksum == checksum:
+            return f"ℹ️ Skipping {filename}, already loaded (checksum match)"
+
+        has_rows = conn.execute(select(table.c[0]).limit(1)).first() is not None
+        if has_rows and not (entry and RELOAD_CHANGED):
+            if entry:
+                return f"⚠️ {filename} changed since it was loaded; set SEED_RELOAD_CHANGED=1 to reload {table.name}"
+            # Seeded before the manifest existed: adopt it as loaded
+            _record_manifest(conn, filename, table.name, checksum, None)
+            return f"ℹ️ Skipping {filename}, {table.name} already has data"
+        target = table
+        if has_rows:
+            # Reload: COPY into a session-local staging copy, then merge
+            target = Table(
+                f"{table.name}_seed",
+                MetaData(),
+                *(Column(c.name, c.type) for c in table.columns),
+                prefixes=["TEMPORARY"],
+                postgresql_on_commit="DROP",
+            )
+            target.create(conn)
+
+        rows = 0
+        try:
+            # From the whole file, so a key first seen late isn't dropped
+            columns = _columns(table, _present_keys(path))
+            for batch in _batches(iter_records(path), BATCH_SIZE):
+                _copy_batch(conn, target, columns, batch)
+                rows += len(batch)
+            if has_rows and columns:
+                updated, inserted = _merge_staged(conn, table, target, columns)
+        except Exception as e:
+            raise RuntimeError(f"❌ Error loading {filename}: {e}") from e
+
+        if model is models.Stock:
+            # Seeded holdings bypass the incremental summary updates
+            rebuild_summaries(conn)
+        _record_manifest(conn, filename, table.name, checksum, rows)
+        bump_version(conn, table.name)
+    if has_rows and columns:
+        return f"✅ Merged {filename} into {table.name}: {updated} updated, {inserted} added"
+    return f"✅ Imported {rows} records into {table.name}"
+
+
+def _record_manifest(conn, filename, table_name, checksum, rows):
+    manifest = models.SeedManifest.__table__
+    stmt = pg_insert(manifest).values(
+        filename=filename,
+        table_name=table_name,
+        checksum=checksum,
+        rows=rows,
+        loaded_at=date.today(),
+    )
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[manifest.c.filename],
+            set_={
+                "checksum": stmt.excluded.checksum,
+                "rows": stmt.excluded.rows,
+                "loaded_at": stmt.excluded.loaded_at,
+            },
+        )
+    )
+
+
+def load_initial_data():
+    """
+    Seed every table from DATA_DIR. Tables are independent, so they load
+    in parallel, each in its own transaction together with its manifest row.
+    """
+    with ThreadPoolExecutor(max_workers=SEED_WORKERS) as pool:
+        futures = [
+            pool.submit(_load_file, filename, model)
+            for filename, model in TABLE_FILE_MODEL_MAP.items()
+        ]
+        for future in futures:
+            try:
+                print(future.result())
+            except Exception as e:
+                print(e)
@@ -35,3 +35,58 @@ def init_db():
     from app import models  # import models so Base knows tables
 
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+
+def upgrade_schema():
+    """
+    create_all() skips tables that already exist, so bring those up to
+    the models: add missing columns and create missing indexes. Both steps
+    are idempotent. Uniqueness changes still need a manual migration (see
+    backend.md); indexes whose uniqueness differs from the model and
+    missing unique constraints are reported.
+    """
+    from sqlalchemy import UniqueConstraint, inspect, text
+    from sqlalchemy.schema import CreateIndex
+
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        ddl = conn.dialect.ddl_compiler(conn.dialect, None)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    print(f"⚠️ {table.name}.{column.name} needs a manual migration")
+                    continue
+                conn.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN '
+                        f"{ddl.get_column_specification(column)}"
+                    )
+                )
+                print(f"✅ Added column {table.name}.{column.name}")
+            unique = {i["name"]: i["unique"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in unique and bool(index.unique) != bool(
+                    unique[index.name]
+                ):
+                    should = "unique" if index.unique else "non-unique"
+                    print(
+                        f"⚠️ {index.name} should be {should}; needs a manual migration"
+                    )
+                # IF NOT EXISTS: inspectors don't list every expression index
+                conn.execute(CreateIndex(index, if_not_exists=True))
+            constraints = {
+                c["name"] for c in inspector.get_unique_constraints(table.name)
+            }
+            for constraint in table.constraints:
+                if (
+                    isinstance(constraint, UniqueConstraint)
+                    and constraint.name
+                    and constraint.name not in constraints
+                ):
+                    print(f"⚠️ {constraint.name} is missing; needs a manual migration")
@@ -0,0 +1,137 @@
+# app/exports.py
+"""
+Streaming NDJSON / CSV exports of history tables for offline analysis.
+
+Rows come off a server-side cursor (yield_per) and are encoded one
+batch at a time, so memory stays flat however many rows match. The
+generator opens its own session: the request's session is closed
+before the response body is streamed.
+"""
+
+import csv
+import io
+import os
+from datetime import date
+from typing import Iterator, Optional
+
+import orjson
+from sqlalchemy import func, select, union_all
+
+from .database import SessionLocal
+from .models import NotificationHistory, StockRecommendation, archive_tables
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "2000"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# dataset -> (model, date column used for start/end, exported columns)
+DATASETS = {
+    "recommendations": (
+        StockRecommendation,
+        "recommendation_date",
+        (
+            "id",
+            "ticker",
+            "company_name",
+            "sector",
+            "current_price",
+            "target_price",
+            "recommendation",
+            "confidence_score",
+            "timeframe",
+            "reasons",
+            "analysis_type",
+            "alert_time",
+            "recommendation_date",
+            "is_active",
+            "created_at",
+        ),
+    ),
+    "notifications": (
+        NotificationHistory,
+        "sent_at",
+        (
+            "id",
+            "user_id",
+            "notification_type",
+            "title",
+            "message",
+            "ticker",
+            "sent_at",
+            "read_at",
+            "archived_at",
+            "created_at",
+        ),
+    ),
+}
+
+
+def _select(
+    table,
+    date_col: str,
+    columns: tuple,
+    start: Optional[date],
+    end: Optional[date],
+    ticker: Optional[str],
+    user_id: Optional[str],
+):
+    c = table.c
+    q = select(*(c[name] for name in columns))
+    if start:
+        q = q.where(c[date_col] >= start)
+    if end:
+        q = q.where(c[date_col] <= end)
+    if ticker:
+        q = q.where(func.upper(c.ticker) == ticker.strip().upper())
+    if user_id and "user_id" in c:
+        q = q.where(c.user_id == user_id)
+    return q
+
+
+def export_query(
+    dataset: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    ticker: Optional[str] = None,
+    user_id: Optional[str] = None,
+    include_archived: bool = False,
+):
+    """Rows of `dataset` ordered by (date, id); KeyError for unknown datasets"""
+    model, date_col, columns = DATASETS[dataset]
+
+    def rows_of(table):
+        return _select(table, date_col, columns, start, end, ticker, user_id)
+
+    if include_archived:
+        rows = union_all(
+            rows_of(model.__table__), rows_of(archive_tables[model.__tablename__])
+        ).subquery()
+        q = select(rows).order_by(rows.c[date_col], rows.c.id)
+    else:
+        table = model.__table__
+        q = rows_of(table).order_by(table.c[date_col], table.c.id)
+    return q, columns
+
+
+def stream_rows(query, columns: tuple, fmt: str) -> Iterator[bytes]:
+    """Encode the query result batch by batch"""
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            yield buf.getvalue().encode()
+            for batch in result.partitions():
+                buf.seek(0)
+                buf.truncate()
+                writer.writerows(batch)
+                yield buf.getvalue().encode()
+        else:
+            for batch in result.partitions():
+                yield b"".join(
+                    orjson.dumps(dict(zip(columns, row))) + b"\n" for row in batch
+                )
+    finally:
+        db.close()
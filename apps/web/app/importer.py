@@ -0,0 +1,180 @@
+# app/importer.py
+"""
+Bulk portfolio import.
+
+The request body is consumed chunk by chunk and split into records
+(a quoted CSV field may span lines), rows are validated in batches, and
+each batch is written with a single
+INSERT ... ON CONFLICT (user_id, ticker) DO UPDATE.
+"""
+
+import codecs
+import csv
+import json
+from datetime import date
+from typing import AsyncIterator, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import Stock
+
+BATCH_SIZE = 1000
+# Keep the response bounded even for a file full of bad rows
+MAX_REPORTED_ERRORS = 500
+# A quoted CSV field left open swallows at most this many lines
+MAX_RECORD_LINES = 100
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json": "ndjson",
+}
+
+UPDATABLE = (
+    "company_name",
+    "sector",
+    "nifty_group",
+    "buy_price",
+    "current_price",
+    "change_value",
+    "change_percent",
+    "volume",
+    "market_cap",
+)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Yield decoded lines from a byte stream without buffering it all"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(fmt: str, lines: AsyncIterator[str]):
+    """
+    Yield (line_no, text) per record, line_no being the record's first
+    line. CSV lines are joined while a quoted field is still open (odd
+    number of quotes so far), so csv.reader sees embedded newlines.
+    """
+    line_no = 0
+    start, parts, quotes = 0, [], 0
+    async for line in lines:
+        line_no += 1
+        if fmt != "csv":
+            yield line_no, line
+            continue
+        if not parts:
+            start = line_no
+        parts.append(line)
+        quotes += line.count('"')
+        if quotes % 2 and len(parts) < MAX_RECORD_LINES:
+            continue
+        yield start, "\n".join(parts)
+        parts, quotes = [], 0
+    if parts:
+        yield start, "\n".join(parts)
+
+
+def parse_rows(fmt: str, lines: List[Tuple[int, str]], header: Optional[list]):
+    """Turn raw (line_no, text) pairs into (line_no, dict | error str)"""
+    out = []
+    if fmt == "csv":
+        for line_no, text in lines:
+            try:
+                fields = next(csv.reader([text]), [])
+            except csv.Error as e:
+                out.append((line_no, f"invalid CSV: {e}"))
+                continue
+            if len(fields) != len(header):
+                out.append((line_no, f"expected {len(header)} columns"))
+                continue
+            out.append(
+                (line_no, {k: (v.strip() or None) for k, v in zip(header, fields)})
+            )
+    else:
+        for line_no, text in lines:
+            try:
+                obj = json.loads(text)
+            except json.JSONDecodeError as e:
+                out.append((line_no, f"invalid JSON: {e.msg}"))
+                continue
+            if not isinstance(obj, dict):
+                out.append((line_no, "expected a JSON object"))
+                continue
+            out.append((line_no, obj))
+    return out
+
+
+def validate_batch(schema: type, parsed, user_id: str):
+    """
+    Validate parsed rows against `schema`; returns (records, errors).
+    Later rows for the same ticker win, since one INSERT cannot touch a
+    row twice.
+    """
+    records, errors = {}, []
+    for line_no, row in parsed:
+        if isinstance(row, str):
+            errors.append({"line": line_no, "error": row})
+            continue
+        try:
+            item: BaseModel = schema(**row)
+        except ValidationError as e:
+            errors.append(
+                {
+                    "line": line_no,
+                    "ticker": row.get("ticker"),
+                    "error": "; ".join(
+                        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}"
+                        for err in e.errors()
+                    ),
+                }
+            )
+            continue
+        rec = item.model_dump()
+        rec["ticker"] = rec["ticker"].strip().upper()
+        rec["user_id"] = user_id
+        qty, buy, cur = (
+            rec.get("volume"),
+            rec.get("buy_price"),
+            rec.get("current_price"),
+        )
+        # Derived only when computable; None keeps the stored value on update
+        if rec.get("change_value") is None and cur and buy and qty:
+            rec["change_value"] = (cur - buy) * qty
+        if rec.get("change_percent") is None and rec.get("change_value") is not None:
+            rec["change_percent"] = (
+                round(rec["change_value"] / (buy * qty) * 100, 2) if buy and qty else 0
+            )
+        rec["last_updated"] = date.today()
+        rec["created_at"] = date.today()
+        records[rec["ticker"]] = rec
+    return list(records.values()), errors
+
+
+def upsert_batch(db, records: List[dict]) -> int:
+    """One INSERT ... ON CONFLICT for the whole batch"""
+    if not records:
+        return 0
+    stmt = pg_insert(Stock).values(records)
+    # Blank fields in the file keep whatever the holding already had
+    set_ = {
+        col: func.coalesce(stmt.excluded[col], Stock.__table__.c[col])
+        for col in UPDATABLE
+    }
+    set_["last_updated"] = stmt.excluded.last_updated
+    db.execute(
+        stmt.on_conflict_do_update(constraint="uq_stocks_user_ticker", set_=set_)
+    )
+    return len(records)
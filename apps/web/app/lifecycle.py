@@ -0,0 +1,125 @@
+# app/lifecycle.py
+"""
+Startup work that must not block serving: schema creation, seeding and
+cache warm-up run in a background thread (or ahead of time through
+`python -m app.manage`), and /ready reports when they are done.
+
+With several workers, schema/seed run under a Postgres advisory lock so
+exactly one does the work while the rest wait and then find it done.
+"""
+
+import os
+import threading
+import time
+
+from app import coordination
+from app.database import SessionLocal, init_db
+
+# Set to "false" when migrations/seeding run as a separate deploy step
+BOOTSTRAP_ON_STARTUP = os.getenv("BOOTSTRAP_ON_STARTUP", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+state = {
+    "schema": False,
+    "seed": False,
+    "caches": False,
+    "error": None,
+    "started_at": time.time(),
+    "ready_at": None,
+}
+
+
+def migrate():
+    init_db()
+    state["schema"] = True
+
+
+def seed():
+    from app.data_loader import load_initial_data
+
+    load_initial_data()
+    state["seed"] = True
+
+
+def warm_caches():
+    from app.sectors import sector_aggregator
+
+    db = SessionLocal()
+    try:
+        sector_aggregator.load(db)
+    finally:
+        db.close()
+    state["caches"] = True
+
+
+def bootstrap(run_migrations: bool = True):
+    try:
+        if run_migrations:
+            with coordination.advisory_lock("bootstrap"):
+                migrate()
+                seed()
+        else:
+            state["schema"] = state["seed"] = True
+        warm_caches()
+        state["ready_at"] = time.time()
+        print(f"✅ Ready in {state['ready_at'] - state['started_at']:.2f}s")
+    except Exception as e:
+        state["error"] = str(e)
+        print(f"❌ Bootstrap failed: {e}")
+
+
+def _on_holdings_added(data: dict):
+    from app.sectors import sector_aggregator
+
+    db = SessionLocal()
+    try:
+        sector_aggregator.on_holdings_added(db, data)
+    finally:
+        db.close()
+
+
+def _register_handlers():
+    from app import preferences
+    from app.alerts import price_alerts
+    from app.sectors import sector_aggregator
+
+    # Another worker refreshed prices: apply its ticks to the sector sums
+    # and the alert index
+    coordination.subscribe("prices_updated", sector_aggregator.on_prices_updated)
+    coordination.subscribe("prices_updated", price_alerts.on_prices_updated)
+    coordination.subscribe("holdings_added", _on_holdings_added)
+    # Alerts created, cancelled or fired elsewhere; rebuild the alert index
+    coordination.subscribe("price_alerts_changed", lambda _: price_alerts.invalidate())
+    coordination.subscribe(
+        "preferences_updated", lambda data: preferences.invalidate(data.get("user_id"))
+    )
+
+
+def start_background_bootstrap():
+    from app.retention import start_scheduler
+
+    _register_handlers()
+    coordination.start_listener()
+    start_scheduler()
+    threading.Thread(
+        target=bootstrap,
+        kwargs={"run_migrations": BOOTSTRAP_ON_STARTUP},
+        name="bootstrap",
+        daemon=True,
+    ).start()
+
+
+def readiness() -> dict:
+    ready = state["schema"] and state["seed"] and state["caches"]
+    return {
+        "ready": bool(ready),
+        "schema": state["schema"],
+        "seed": state["seed"],
+        "caches_warm": state["caches"],
+        "error": state["error"],
+        "data_versions": coordination.data_versions(),
+        "uptime_seconds": round(time.time() - state["started_at"], 2),
+    }
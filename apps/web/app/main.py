@@ -1,33 +1,74 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Depends, Query, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import date, datetime
-from pydantic import BaseModel
-from typing import List, Optional, Any, Dict
-
-from requests import Session
-from sqlalchemy import func
-from app.database import init_db, get_db
-from app.data_loader import load_initial_data
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import date
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import List, Optional, Any, Dict, Union
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.database import get_db
+from app.lifecycle import readiness, start_background_bootstrap
+from app.coordination import bump_version, publish
 from .models import (
     NiftyIndex,
     SectorPerformance,
     Stock,
+    StockPrice,
     StockRecommendation,
     MarketAnalysis,
     NotificationHistory,
     TechnicalIndicator,
-    UserPreferences,
 )
-from .technical import rsi
+from .exports import DATASETS as EXPORT_DATASETS
+from .exports import FORMATS as EXPORT_FORMATS
+from .exports import export_query, stream_rows
+from .alerts import cancel_alert, create_alert, evaluate_ticks, list_alerts
+from .alerts import price_alerts
+from .recommender import MAX_PICKS, generate_picks, rank_universe
+from .sectors import sector_aggregator
+from .importer import (
+    BATCH_SIZE,
+    CONTENT_TYPES,
+    MAX_REPORTED_ERRORS,
+    iter_lines,
+    iter_records,
+    parse_rows,
+    upsert_batch,
+    validate_batch,
+)
+from .notifications import (
+    archive,
+    delete_notifications,
+    fan_out_in_background,
+    history_page,
+    mark_read,
+    unread_count,
+)
+from .preferences import get_preferences, update_preferences
+from .preferences import invalidate as invalidate_preferences
+from .retention import sentiment_history
+from .snapshots import PERIODS, nav_history, record_snapshots
+from .portfolio import (
+    SORT_KEYS,
+    apply_price_ticks,
+    apply_summary_delta,
+    get_summary,
+    holding_value,
+    rebuild_summaries,
+    value_portfolio,
+)
 from .ai_client import (
     fetch_market_snapshot,
-    fetch_stock_recommendations,
-    generate_recommendation_reasoning,
+    fetch_recommendation_narratives,
     fetch_stock_prices,
+    resilience_stats,
 )
-import random
-import pandas as pd
+import csv
+import orjson
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -46,8 +87,8 @@ app.add_middleware(
 # --- Startup ---
 @app.on_event("startup")
 def on_startup():
-    init_db()
-    load_initial_data()
+    # Schema, seeding and cache warm-up run in the background; see /ready
+    start_background_bootstrap()
 
 
 @app.get("/")
@@ -55,6 +96,22 @@ def root():
     return {"message": "Backend running with Postgres + JSON data loaded!"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once schema, seed data and caches are in place"""
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/api/health/ai")
+def ai_health():
+    """
+    Circuit breaker state, retry/hedge counters and latency percentiles
+    for the Gemini client.
+    """
+    return {"data": resilience_stats()}
+
+
 # --- Schemas ---
 class NiftyIndexIn(BaseModel):
     name: str
@@ -87,11 +144,23 @@ class NotificationPost(BaseModel):
     morning_alerts_enabled: Optional[bool] = None
     afternoon_alerts_enabled: Optional[bool] = None
     notification_id: Optional[int] = None
+    notification_ids: Optional[List[int]] = None
+    before: Optional[str] = None  # cursor from GET /api/notifications
+
+
+# --- Price Alert Schemas ---
+class PriceAlertIn(BaseModel):
+    user_id: str = "default_user"
+    ticker: str
+    threshold: float = Field(gt=0)
+    # Inferred from the current price when omitted
+    direction: Optional[str] = Field(None, pattern="^(above|below)$")
 
 
 # --- Portfolio Schemas ---
 class StockIn(BaseModel):
     ticker: str
+    user_id: Optional[str] = "default_user"
     company_name: Optional[str] = None
     sector: Optional[str] = None
     nifty_group: Optional[str] = None
@@ -102,146 +171,238 @@ class StockIn(BaseModel):
     volume: Optional[int] = None
     market_cap: Optional[float] = None
 
-
-def get_realistic_timeframe(
-    alert_time: str, recommendation_type: str, confidence: float
-) -> str:
+    @field_validator("ticker")
+    @classmethod
+    def normalize_ticker(cls, v: str) -> str:
+        # Same key whether a holding comes from the form or a bulk import
+        v = v.strip().upper()
+        if not v:
+            raise ValueError("ticker must not be blank")
+        return v
+
+
+# --- Response Schemas ---
+# Declared models are serialized by pydantic-core straight from the
+# column-only query rows; keep field names in sync with the mobile client.
+class RowModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+
+class NiftyIndexOut(RowModel):
+    name: Optional[str]
+    current_value: Optional[float]
+    change_value: Optional[float]
+    change_percent: Optional[float]
+    is_positive: bool
+
+
+class NiftyIndexList(BaseModel):
+    data: List[NiftyIndexOut]
+
+
+class RecommendationOut(RowModel):
+    id: int
+    ticker: Optional[str]
+    company_name: Optional[str]
+    sector: Optional[str]
+    current_price: Optional[float]
+    target_price: Optional[float]
+    recommendation: Optional[str]
+    confidence_score: Optional[float]
+    timeframe: Optional[str]
+    reasons: Optional[str]
+    alert_time: Optional[str]
+
+
+class RecommendationList(BaseModel):
+    data: List[RecommendationOut]
+
+
+class TechnicalIndicatorOut(RowModel):
+    ticker: Optional[str]
+    rsi: Optional[str]
+    macd: Optional[str]
+    moving_avg_50: Optional[str]
+    moving_avg_200: Optional[str]
+    bollinger_upper: Optional[str]
+    bollinger_lower: Optional[str]
+    support_level: Optional[str]
+    resistance_level: Optional[str]
+    analysis_date: Optional[date]
+
+
+class SectorOut(RowModel):
+    name: Optional[str]
+    performance: Optional[str]
+    trend: Optional[str]
+    market_cap: Optional[str]
+    analysis_date: Optional[date]
+    # Only present for sectors derived from the price store
+    weight_percent: Optional[float] = None
+    constituents: Optional[int] = None
+
+
+class AnalysisOut(BaseModel):
+    date: Optional[date]
+    bullish_sentiment: Optional[float]
+    bearish_sentiment: Optional[float]
+    market_trend: Optional[str]
+    fear_greed_index: Optional[float]
+    volatility_index: Optional[str]
+    technicalIndicators: List[TechnicalIndicatorOut]
+    sectors: List[SectorOut]
+    keyLevels: Dict[str, Optional[float]]
+
+
+class AnalysisResponse(BaseModel):
+    # {} until the first market analysis is stored
+    data: Union[AnalysisOut, Dict[str, Any]] = Field(union_mode="left_to_right")
+
+
+class FastJSONResponse(JSONResponse):
     """
-    Generate a realistic timeframe for the recommendation.
-    - Intraday alerts -> very short timeframes
-    - High confidence BUY -> longer hold times
-    - Low confidence -> shorter hold times
+    orjson-rendered response for large dict payloads without a response
+    model. Return it directly so FastAPI skips jsonable_encoder.
     """
-    if alert_time == "10_AM":  # Morning alerts → short-term
-        return random.choice(["1-3 Days", "1 Week"])
-
-    if recommendation_type == "BUY":
-        if confidence > 0.85:
-            return random.choice(["6-12 Months", "1 Year"])
-        elif confidence > 0.75:
-            return random.choice(["1-3 Months", "3-6 Months"])
-        else:
-            return random.choice(["1-3 Weeks", "1-3 Months"])
 
-    if recommendation_type == "SELL":
-        return random.choice(["1-3 Days", "1 Week", "1-2 Weeks"])
-
-    # HOLD case
-    return random.choice(["2-4 Weeks", "1-3 Months"])
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
 
 
 # --- Endpoints ---
 
 
-@app.get("/api/stocks/nifty-indices")
+@app.get("/api/stocks/nifty-indices", response_model=NiftyIndexList)
 def get_nifty_indices(db=Depends(get_db)):
-    rows = db.query(NiftyIndex).all()
-    out = []
-    for r in rows:
-        out.append(
-            {
-                "name": r.name,
-                "current_value": r.current_value,
-                "change_value": r.change_value,
-                "change_percent": r.change_percent,
-                "is_positive": True if r.change_value >= 0 else False,
-            }
+    rows = db.execute(
+        select(
+            NiftyIndex.name,
+            NiftyIndex.current_value,
+            NiftyIndex.change_value,
+            NiftyIndex.change_percent,
+            (func.coalesce(NiftyIndex.change_value, 0) >= 0).label("is_positive"),
         )
-    return {"data": out}
+    ).all()
+    return {"data": rows}
 
 
-@app.get("/api/stocks/recommendations")
+@app.get("/api/stocks/recommendations", response_model=RecommendationList)
 def get_recommendations(
     alert_time: Optional[str] = Query(None),
     date_q: Optional[date] = Query(None, alias="date"),
+    active: Optional[bool] = Query(None),
     limit: Optional[int] = 20,
     db=Depends(get_db),
 ):
-    q = db.query(StockRecommendation)
+    r = StockRecommendation
+    q = select(
+        r.id,
+        r.ticker,
+        r.company_name,
+        r.sector,
+        r.current_price,
+        r.target_price,
+        r.recommendation,
+        r.confidence_score,
+        r.timeframe,
+        r.reasons,
+        r.alert_time,
+    )
     if alert_time:
-        q = q.filter(StockRecommendation.alert_time == alert_time)
+        q = q.where(r.alert_time == alert_time)
     if date_q:
-        q = q.filter(StockRecommendation.recommendation_date == date_q)
-    rows = q.order_by(StockRecommendation.created_at.desc()).limit(limit).all()
-    out = []
-    for r in rows:
-        out.append(
-            {
-                "id": r.id,
-                "ticker": r.ticker,
-                "company_name": r.company_name,
-                "sector": r.sector,
-                "current_price": r.current_price,
-                "target_price": r.target_price,
-                "recommendation": r.recommendation,
-                "confidence_score": r.confidence_score,
-                "timeframe": r.timeframe,
-                "reasons": r.reasons,
-                "alert_time": r.alert_time,
-            }
-        )
-    return {"data": out}
+        q = q.where(r.recommendation_date == date_q)
+    if active is not None:
+        # NULL (rows from before is_active was maintained) counts as active
+        q = q.where(r.is_active.is_not(False) if active else r.is_active.is_(False))
+    rows = db.execute(q.order_by(r.created_at.desc()).limit(limit)).all()
+    return {"data": rows}
+
+
+@app.get("/api/stocks/rankings")
+def get_rankings(alert_time: str = Query("10_AM"), limit: int = 50, db=Depends(get_db)):
+    """
+    Full-universe ranking from the local scoring engine (no LLM involved).
+    """
+    ranked = rank_universe(db, alert_time)
+    return FastJSONResponse({"data": ranked[:limit], "universe_size": len(ranked)})
+
+
+@app.get("/api/stocks/backtest")
+def get_backtest(
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    db=Depends(get_db),
+):
+    """
+    Historical performance of stored recommendations: hit rate,
+    time-to-target, returns and drawdown per strategy, alert_time and sector.
+    """
+    from .backtest import backtest_summary  # pulls in pandas; keep it off startup
 
+    return FastJSONResponse({"data": backtest_summary(db, start, end)})
 
-@app.get("/api/stocks/analysis")
+
+@app.get("/api/stocks/analysis", response_model=AnalysisResponse)
 def get_analysis(db=Depends(get_db)):
     # Fetch latest market analysis
-    row = db.query(MarketAnalysis).order_by(MarketAnalysis.id.desc()).first()
+    m = MarketAnalysis
+    row = db.execute(
+        select(
+            m.analysis_date.label("date"),
+            m.bullish_sentiment,
+            m.bearish_sentiment,
+            m.market_trend,
+            m.fear_greed_index,
+            m.volatility_index,
+        )
+        .order_by(m.id.desc())
+        .limit(1)
+    ).first()
     if not row:
         return {"data": {}}
 
     # Fetch technical indicators (latest per ticker)
-    indicators = (
-        db.query(TechnicalIndicator)
-        .order_by(TechnicalIndicator.analysis_date.desc())
-        .limit(10)  # you can adjust number of indicators sent
-        .all()
-    )
-
-    tech_list = []
-    for ti in indicators:
-        tech_list.append(
-            {
-                "ticker": ti.ticker,
-                "rsi": ti.rsi_14,
-                "macd": ti.macd,
-                "moving_avg_50": ti.moving_avg_50,
-                "moving_avg_200": ti.moving_avg_200,
-                "bollinger_upper": ti.bollinger_upper,
-                "bollinger_lower": ti.bollinger_lower,
-                "support_level": ti.support_level,
-                "resistance_level": ti.resistance_level,
-                "analysis_date": (
-                    ti.analysis_date.isoformat() if ti.analysis_date else None
-                ),
-            }
-        )
-
-    # Fetch latest sector performance
-    sectors = (
-        db.query(SectorPerformance)
-        .order_by(SectorPerformance.analysis_date.desc())
-        .all()
-    )
-
-    sector_list = []
-    for s in sectors:
-        sector_list.append(
-            {
-                "name": s.sector_name,
-                "performance": s.performance_percent,
-                "trend": s.trend,  # "positive" or "negative"
-                "market_cap": s.market_cap,
-                "analysis_date": (
-                    s.analysis_date.isoformat() if s.analysis_date else None
-                ),
-            }
+    ti = TechnicalIndicator
+    indicators = db.execute(
+        select(
+            ti.ticker,
+            ti.rsi_14.label("rsi"),
+            ti.macd,
+            ti.moving_avg_50,
+            ti.moving_avg_200,
+            ti.bollinger_upper,
+            ti.bollinger_lower,
+            ti.support_level,
+            ti.resistance_level,
+            ti.analysis_date,
         )
+        .order_by(ti.analysis_date.desc())
+        .limit(10)  # you can adjust number of indicators sent
+    ).all()
+
+    # Sector performance derived from holdings and the price store;
+    # stored rows (seed data / LLM snapshot) only when no prices exist yet
+    sector_aggregator.ensure_loaded(db)
+    sector_list = sector_aggregator.snapshot()
+    if not sector_list:
+        sp = SectorPerformance
+        sector_list = db.execute(
+            select(
+                sp.sector_name.label("name"),
+                sp.performance_percent.label("performance"),
+                sp.trend,  # "positive" or "negative"
+                sp.market_cap,
+                sp.analysis_date,
+            ).order_by(sp.analysis_date.desc())
+        ).all()
 
     # Compute key support/resistance from latest technical indicators
-    support_levels = [float(ti.support_level) for ti in indicators if ti.support_level]
+    support_levels = [float(t.support_level) for t in indicators if t.support_level]
     resistance_levels = [
-        float(ti.resistance_level) for ti in indicators if ti.resistance_level
+        float(t.resistance_level) for t in indicators if t.resistance_level
     ]
 
     key_levels = {
@@ -251,19 +412,27 @@ def get_analysis(db=Depends(get_db)):
 
     return {
         "data": {
-            "date": row.analysis_date.isoformat() if row.analysis_date else None,
-            "bullish_sentiment": row.bullish_sentiment,
-            "bearish_sentiment": row.bearish_sentiment,
-            "market_trend": row.market_trend,
-            "fear_greed_index": row.fear_greed_index,
-            "volatility_index": row.volatility_index,
-            "technicalIndicators": tech_list,
+            **row._asdict(),
+            "technicalIndicators": indicators,
             "sectors": sector_list,
             "keyLevels": key_levels,
         }
     }
 
 
+@app.get("/api/stocks/analysis/sentiment-history")
+def get_sentiment_history(
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    db=Depends(get_db),
+):
+    """
+    Daily sentiment rollup; outlives the raw market_analysis rows, which
+    the retention job archives.
+    """
+    return FastJSONResponse({"data": sentiment_history(db, start, end)})
+
+
 @app.post("/api/stocks/analysis")
 def post_analysis(payload: Dict[str, Any], db=Depends(get_db)):
     """
@@ -304,41 +473,41 @@ def post_analysis(payload: Dict[str, Any], db=Depends(get_db)):
 
 @app.get("/api/notifications")
 def get_notifications(
-    user_id: Optional[str] = "default_user", limit: int = 20, db=Depends(get_db)
+    user_id: Optional[str] = "default_user",
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
+    db=Depends(get_db),
 ):
-    prefs = db.query(UserPreferences).filter_by(user_id=user_id).first()
-    if not prefs:
-        prefs = UserPreferences(user_id=user_id, created_at=date.today())
-        db.add(prefs)
-        db.commit()
-    rows = (
-        db.query(NotificationHistory)
-        .filter_by(user_id=user_id)
-        .order_by(NotificationHistory.sent_at.desc())
-        .limit(limit)
-        .all()
-    )
-    history = [
-        {
-            "id": r.id,
-            "title": r.title,
-            "message": r.message,
-            "notification_type": r.notification_type,
-            "sent_at": r.sent_at.isoformat() if r.sent_at else None,
-            "read_at": r.read_at.isoformat() if r.read_at else None,
-        }
-        for r in rows
-    ]
+    """
+    Preferences plus a keyset-paginated page of history.
+    Pass `cursor=<next_cursor>` for older rows, or `since=<sync_cursor>`
+    to fetch only what arrived since the last sync.
+    """
+    prefs = get_preferences(db, user_id)
+    try:
+        page = history_page(db, user_id, limit=limit, cursor=cursor, since=since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
     return {
         "preferences": {
-            "push_notifications_enabled": prefs.push_notifications_enabled,
-            "morning_alerts_enabled": prefs.morning_alerts_enabled,
-            "afternoonAlertsEnabled": prefs.afternoon_alerts_enabled,
+            "push_notifications_enabled": prefs["push_notifications_enabled"],
+            "morning_alerts_enabled": prefs["morning_alerts_enabled"],
+            "afternoonAlertsEnabled": prefs["afternoon_alerts_enabled"],
         },
-        "history": history,
+        "unread_count": unread_count(db, user_id),
+        **page,
     }
 
 
+BULK_ACTIONS = {
+    "mark_as_read": mark_read,
+    "mark_all_as_read": mark_read,
+    "archive": archive,
+    "delete": delete_notifications,
+}
+
+
 @app.post("/api/notifications")
 def post_notifications(payload: NotificationPost, db=Depends(get_db)):
     typ = payload.type
@@ -358,43 +527,62 @@ def post_notifications(payload: NotificationPost, db=Depends(get_db)):
         db.commit()
         return {"status": "sent"}
     elif typ == "update_preferences":
-        print("Preferences payload:", payload)
-        prefs = db.query(UserPreferences).filter_by(user_id=user_id).first()
-        if not prefs:
-            prefs = UserPreferences(user_id=user_id, created_at=date.today())
-            db.add(prefs)
-        if payload.push_notifications_enabled is not None:
-            prefs.push_notifications_enabled = payload.push_notifications_enabled
-        if payload.morning_alerts_enabled is not None:
-            prefs.morning_alerts_enabled = payload.morning_alerts_enabled
-        if payload.afternoon_alerts_enabled is not None:
-            prefs.afternoon_alerts_enabled = payload.afternoon_alerts_enabled
+        update_preferences(db, user_id, payload.model_dump())
         db.commit()
+        invalidate_preferences(user_id)
         return {"status": "updated"}
-    elif typ == "mark_as_read":
-        nid = payload.notification_id
-        if not nid:
+    elif typ in BULK_ACTIONS:
+        ids = payload.notification_ids
+        if ids is None and payload.notification_id:
+            ids = [payload.notification_id]
+        # Only mark_all_as_read may target every notification without a filter
+        if ids is None and not payload.before and typ != "mark_all_as_read":
             raise HTTPException(
-                status_code=400, detail="notification_id required for mark_as_read"
+                status_code=400,
+                detail=f"notification_id(s) or before required for {typ}",
             )
-        rec = db.query(NotificationHistory).filter_by(id=nid).first()
-        if not rec:
+        try:
+            affected = BULK_ACTIONS[typ](db, user_id, ids=ids, before=payload.before)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        # A single mark_as_read still 404s on an id the user doesn't have
+        if (
+            typ == "mark_as_read"
+            and not affected
+            and payload.notification_ids is None
+            and payload.notification_id
+            and db.execute(
+                select(NotificationHistory.id).where(
+                    NotificationHistory.id == payload.notification_id,
+                    NotificationHistory.user_id == user_id,
+                )
+            ).first()
+            is None
+        ):
             raise HTTPException(status_code=404, detail="notification not found")
-        rec.read_at = datetime.now()
         db.commit()
-        return {"status": "ok"}
+        return {"status": "ok", "affected": affected}
     else:
         raise HTTPException(status_code=400, detail="unknown type")
 
 
 @app.post("/api/stocks/real-time-update")
-async def realtime_update(payload: dict, db: Session = Depends(get_db)):
+async def realtime_update(
+    payload: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+):
     action = payload.get("action")
 
     if action == "update_market_data":
         snapshot = await fetch_market_snapshot()
         if "error" in snapshot:
             raise HTTPException(status_code=500, detail=snapshot["error"])
+        if snapshot.get("stale"):
+            # Breaker open: the cached snapshot is not today's market
+            return {
+                "status": "stale",
+                "message": "AI service unavailable; market data not updated",
+                "snapshot_saved": False,
+            }
 
         # Save Nifty Indices
         for idx in snapshot.get("nifty_indices", []):
@@ -461,33 +649,63 @@ async def realtime_update(payload: dict, db: Session = Depends(get_db)):
             )
         )
 
-        # Update stock prices in portfolio for list of stock tickers
-        portfolio_stocks = db.query(Stock).all()
-        tickers = [s.ticker for s in portfolio_stocks if s.ticker]
+        # Update stock prices for every ticker held by any user or watched
+        # by a price alert
+        price_alerts.ensure_loaded(db)
+        tickers = db.execute(select(Stock.ticker).distinct()).scalars().all()
+        tickers = sorted({t for t in tickers if t} | price_alerts.tickers())
+        latest_prices = {}
         if tickers:
             price_updates = await fetch_stock_prices(tickers)
             if "error" in price_updates:
                 raise HTTPException(status_code=500, detail=price_updates["error"])
-            for stock in portfolio_stocks:
-                if stock.ticker in price_updates["stock_prices"]:
-                    stock.current_price = price_updates["stock_prices"][stock.ticker][
-                        "current_price"
-                    ]
-                    # Recalculate change_value and change_percent if buy_price and volume are set
-                    if stock.buy_price and stock.volume:
-                        stock.change_value = (
-                            stock.current_price - stock.buy_price
-                        ) * stock.volume
-                        invested_amount = stock.buy_price * stock.volume
-                        stock.change_percent = (
-                            (stock.change_value / invested_amount) * 100
-                            if invested_amount != 0
-                            else 0
-                        )
-                        stock.change_percent = round(stock.change_percent, 2)
-                    stock.last_updated = date.today()
+            # Gemini returns a list of {ticker, current_price}; index it by ticker.
+            # Cached prices served while the breaker is open are not new ticks.
+            latest_prices = {
+                p["ticker"]: p["current_price"]
+                for p in price_updates.get("stock_prices", [])
+                if p.get("ticker") and p.get("current_price") is not None
+            }
+            if price_updates.get("stale"):
+                latest_prices = {}
+        if latest_prices:
+            # Set-based: holdings, change columns and per-user summaries
+            apply_price_ticks(db, latest_prices)
+            record_snapshots(db)
+            alert_hits = evaluate_ticks(db, latest_prices)
+            # Delivered to the other workers on commit; they apply the same
+            # ticks to their sector sums instead of rebuilding them
+            publish(
+                db,
+                "prices_updated",
+                {"date": date.today().isoformat(), "prices": latest_prices},
+            )
+            bump_version(db, "stock_prices")
+
+            # Append today's close to the price history used for ranking
+            stmt = pg_insert(StockPrice).values(
+                [
+                    {
+                        "ticker": ticker,
+                        "price_date": date.today(),
+                        "close": price,
+                        "created_at": date.today(),
+                    }
+                    for ticker, price in latest_prices.items()
+                ]
+            )
+            db.execute(
+                stmt.on_conflict_do_update(
+                    constraint="uq_stock_prices_ticker_date",
+                    set_={"close": stmt.excluded.close},
+                )
+            )
 
         db.commit()
+        if latest_prices:
+            price_alerts.settle(latest_prices, alert_hits)
+            sector_aggregator.ensure_loaded(db)
+            sector_aggregator.apply_ticks(latest_prices, date.today())
         return {
             "status": "ok",
             "message": "Market data updated (simulated)",
@@ -495,13 +713,31 @@ async def realtime_update(payload: dict, db: Session = Depends(get_db)):
         }
 
     elif action == "generate_recommendations":
-        alert_time = payload.get("alert_time", "10_AM")
+        alert_time = payload.get("alert_time") or payload.get("alertTime") or "10_AM"
+
+        try:
+            limit = int(payload.get("limit", 5))
+        except (TypeError, ValueError):
+            limit = 0
+        if not 1 <= limit <= MAX_PICKS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"limit must be an integer between 1 and {MAX_PICKS}",
+            )
+
+        # Picks are ranked locally; the LLM only phrases the reasons
+        # Loads the price matrix and ranks it; keep it off the event loop
+        picks = await run_in_threadpool(generate_picks, db, alert_time, limit=limit)
+        if not picks:
+            raise HTTPException(
+                status_code=409,
+                detail="No price history or technical indicators to rank yet",
+            )
+        narratives = await fetch_recommendation_narratives(picks)
 
-        recos = await fetch_stock_recommendations()
-        if "error" in recos:
-            raise HTTPException(status_code=500, detail=recos["error"])
         created = 0
-        for rec in recos.get("stocks", []):
+        for rec in picks:
+            reasoning = narratives.get(rec["ticker"]) or rec["reasons"]
             existing = (
                 db.query(StockRecommendation)
                 .filter(
@@ -517,119 +753,179 @@ async def realtime_update(payload: dict, db: Session = Depends(get_db)):
                 existing.recommendation = rec["recommendation"]
                 existing.confidence_score = rec["confidence_score"] * 100
                 existing.timeframe = rec["timeframe"]
-                existing.reasons = rec.get("reasons", existing.reasons)
+                existing.reasons = reasoning
+                existing.analysis_type = rec["analysis_type"]
                 existing.current_price = rec["current_price"]
                 existing.target_price = rec["target_price"]
                 existing.recommendation_date = date.today()
                 existing.alert_time = alert_time
             else:
-                # Process each stock recommendation
                 created += 1
-                reasoning = rec.get("reasons")
-                if not reasoning:
-                    prompt = (
-                        f"Generate reasoning for {rec['recommendation']} on {rec['ticker']}, "
-                        f"confidence {rec['confidence_score']*100:.0f}%, timeframe {rec['timeframe']}, sector {rec.get('sector', 'Unknown')}."
-                    )
-                    reasoning = await generate_recommendation_reasoning(prompt)
                 db.add(
                     StockRecommendation(
                         ticker=rec["ticker"],
                         company_name=rec["company_name"],
-                        sector=rec.get("sector", "Unknown"),
+                        sector=rec["sector"],
                         current_price=rec["current_price"],
                         target_price=rec["target_price"],
                         recommendation=rec["recommendation"],
                         confidence_score=rec["confidence_score"] * 100,
                         timeframe=rec["timeframe"],
                         reasons=reasoning,
+                        analysis_type=rec["analysis_type"],
                         alert_time=alert_time,
                         recommendation_date=date.today(),
                         created_at=date.today(),
                     )
                 )
 
-        # Log notification
-        notif = NotificationHistory(
-            user_id="default_user",
-            notification_type="stock_recommendation",
-            title=f"New {alert_time} recommendations",
-            message=f"Alert: {created} new stock recommendations available. Check them out!",
-            sent_at=date.today(),
-            created_at=date.today(),
-        )
-        db.add(notif)
-
+        bump_version(db, "stock_recommendations")
         db.commit()
+
+        # Notify every opted-in user once the picks are committed
+        if created:
+            background_tasks.add_task(
+                fan_out_in_background,
+                alert_time,
+                f"New {alert_time} recommendations",
+                f"Alert: {created} new stock recommendations available. Check them out!",
+                sectors=[rec["sector"] for rec in picks],
+            )
         return {"status": "ok", "created": created}
 
     else:
         raise HTTPException(status_code=400, detail="Unknown action")
 
 
+# --- Export Endpoints ---
+
+
+@app.get("/api/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    ticker: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    include_archived: bool = Query(False),
+):
+    """
+    Stream full recommendation / notification history as NDJSON or CSV,
+    filtered by date range, ticker and (notifications) user_id.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"dataset must be one of {', '.join(sorted(EXPORT_DATASETS))}",
+        )
+    query, columns = export_query(
+        dataset, start, end, ticker, user_id, include_archived
+    )
+    return StreamingResponse(
+        stream_rows(query, columns, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{fmt}"'},
+    )
+
+
+# --- Price Alert Endpoints ---
+
+
+@app.get("/api/stocks/alerts")
+def get_price_alerts(
+    user_id: str = Query("default_user"),
+    active: Optional[bool] = Query(None),
+    db=Depends(get_db),
+):
+    return {"data": list_alerts(db, user_id, active)}
+
+
+@app.post("/api/stocks/alerts")
+def add_price_alert(payload: PriceAlertIn, db=Depends(get_db)):
+    """
+    Notify the user once when the ticker crosses the threshold on a
+    price refresh (update_market_data).
+    """
+    try:
+        alert = create_alert(
+            db, payload.user_id, payload.ticker, payload.threshold, payload.direction
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    price_alerts.add(**alert)
+    return {"status": "created", "data": alert}
+
+
+@app.delete("/api/stocks/alerts/{alert_id}")
+def delete_price_alert(
+    alert_id: int, user_id: str = Query("default_user"), db=Depends(get_db)
+):
+    alert = cancel_alert(db, user_id, alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="active alert not found")
+    db.commit()
+    price_alerts.remove(**alert)
+    return {"status": "cancelled", "data": alert}
+
+
 # --- Portfolio Endpoints ---
 
 
 @app.get("/api/stock/portfolio")
-def get_portfolio(db=Depends(get_db)):
+def get_portfolio(
+    user_id: str = Query("default_user"),
+    sort_by: str = Query("ticker"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    db=Depends(get_db),
+):
     """
-    Fetch all stocks saved in the user's portfolio.
+    Fetch all stocks saved in the user's portfolio, valued in one pass:
+    per-holding P&L and day change, totals, and sector / nifty_group
+    allocation. Totals always cover the whole portfolio, not just the page.
     """
-    rows = db.query(Stock).all()
-
-    out = []
-    total_invested = 0
-    total_current = 0
-    total_change = 0
-    for r in rows:
-        # compute change if not already stored
-        change_value = r.change_value
-        change_percent = r.change_percent
-        invested_amount = (r.buy_price * r.volume) if r.buy_price else 0
-        if (
-            r.current_price is not None
-            and r.buy_price is not None
-            and r.volume is not None
-        ):
-            change_value = r.current_price * r.volume - r.buy_price * r.volume
-            change_percent = (
-                (change_value / invested_amount) * 100 if invested_amount != 0 else 0
-            )
-        total_invested += invested_amount
-        total_current += r.current_price * r.volume
-
-        out.append(
-            {
-                "id": r.id,
-                "ticker": r.ticker,
-                "company_name": r.company_name,
-                "sector": r.sector,
-                "nifty_group": r.nifty_group,
-                "buy_price": round(r.buy_price, 2) if r.buy_price else 0,
-                "current_price": round(r.current_price, 2) if r.current_price else 0,
-                "invested_amount": round(invested_amount, 2),
-                "change_value": round(change_value, 2) if change_value else 0,
-                "change_percent": round(change_percent, 2) if change_percent else 0,
-                "is_positive": True if change_value and change_value >= 0 else False,
-                "volume": r.volume,
-                "market_cap": r.market_cap,
-                "last_updated": r.last_updated.isoformat() if r.last_updated else None,
-            }
+    if sort_by not in SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sort_by must be one of {', '.join(sorted(SORT_KEYS))}",
         )
+    return FastJSONResponse(
+        value_portfolio(
+            db, user_id, sort_by=sort_by, order=order, limit=limit, offset=offset
+        )
+    )
 
-    total_change = round(total_current - total_invested, 2)
 
-    return {
-        "data": out,
-        "total_invested": round(total_invested, 2),
-        "total_current": round(total_current, 2),
-        "total_change": round(total_change, 2),
-        "total_change_percent": (
-            round((total_change / total_invested * 100), 2)
-            if total_invested != 0
-            else 0
-        ),
-    }
+@app.get("/api/stock/portfolio/summary")
+def get_portfolio_summary(user_id: str = Query("default_user"), db=Depends(get_db)):
+    """
+    Portfolio header (invested, current value, change) from the
+    precomputed per-user summary row.
+    """
+    return {"data": get_summary(db, user_id)}
+
+
+@app.get("/api/stock/portfolio/history")
+def get_portfolio_history(
+    user_id: str = Query("default_user"),
+    period: str = Query("day"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    db=Depends(get_db),
+):
+    """
+    NAV time series for charts, read from the pre-aggregated snapshots.
+    """
+    if period not in PERIODS:
+        raise HTTPException(
+            status_code=400, detail=f"period must be one of {', '.join(PERIODS)}"
+        )
+    return FastJSONResponse(
+        {"data": nav_history(db, user_id, period, start, end), "period": period}
+    )
 
 
 @app.post("/api/stock/portfolio")
@@ -653,7 +949,14 @@ def add_to_portfolio(payload: StockIn, db=Depends(get_db)):
             else 0
         )
 
-    existing = db.query(Stock).filter_by(ticker=payload.ticker).first()
+    user_id = payload.user_id or "default_user"
+    existing = db.query(Stock).filter_by(user_id=user_id, ticker=payload.ticker).first()
+    old_invested, old_value = (
+        holding_value(existing.buy_price, existing.current_price, existing.volume)
+        if existing
+        else (0.0, 0.0)
+    )
+    is_new = existing is None
     if existing:
         # update existing stock
         existing.company_name = payload.company_name or existing.company_name
@@ -672,6 +975,7 @@ def add_to_portfolio(payload: StockIn, db=Depends(get_db)):
     else:
         # create new stock
         new_stock = Stock(
+            user_id=user_id,
             ticker=payload.ticker,
             company_name=payload.company_name,
             sector=payload.sector,
@@ -688,6 +992,101 @@ def add_to_portfolio(payload: StockIn, db=Depends(get_db)):
         db.add(new_stock)
         existing = new_stock
 
+    # Keep the user's summary row in step with this holding
+    new_invested, new_value = holding_value(
+        existing.buy_price, existing.current_price, existing.volume
+    )
+    apply_summary_delta(
+        db,
+        user_id,
+        invested=new_invested - old_invested,
+        value=new_value - old_value,
+        holdings=1 if is_new else 0,
+    )
+    if is_new:
+        # Every worker adds the ticker to its sector table
+        publish(db, "holdings_added", {"tickers": [existing.ticker]})
     db.commit()
     db.refresh(existing)
+    if is_new:
+        sector_aggregator.add_tickers(db, [existing.ticker])
     return {"status": "ok", "message": f"Stock {existing.ticker} added/updated"}
+
+
+@app.post("/api/stock/portfolio/import")
+async def import_portfolio(
+    request: Request,
+    user_id: str = Query("default_user"),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db=Depends(get_db),
+):
+    """
+    Bulk import holdings from a raw CSV (header row required) or NDJSON
+    body, e.g. `curl --data-binary @holdings.csv -H 'Content-Type: text/csv'`.
+    The body is streamed; rows are validated and upserted in batches and
+    per-row errors are returned with their line numbers.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = format or CONTENT_TYPES.get(content_type)
+    if not fmt:
+        raise HTTPException(
+            status_code=415, detail="send text/csv or application/x-ndjson"
+        )
+
+    def flush(lines, header):
+        records, errors = validate_batch(
+            StockIn, parse_rows(fmt, lines, header), user_id
+        )
+        written = upsert_batch(db, records)
+        db.commit()
+        tickers.update(r["ticker"] for r in records)
+        return written, errors
+
+    tickers = set()
+
+    header = None
+    batch = []
+    imported = 0
+    errors = []
+    error_count = 0
+    rows_seen = 0
+    async for line_no, line in iter_records(fmt, iter_lines(request.stream())):
+        if not line.strip():
+            continue
+        if fmt == "csv" and header is None:
+            header = [h.strip().lower() for h in next(csv.reader([line]))]
+            if "ticker" not in header:
+                raise HTTPException(status_code=400, detail="CSV needs a ticker column")
+            continue
+        rows_seen += 1
+        batch.append((line_no, line))
+        if len(batch) >= BATCH_SIZE:
+            written, batch_errors = await run_in_threadpool(flush, batch, header)
+            imported += written
+            error_count += len(batch_errors)
+            errors.extend(batch_errors[: MAX_REPORTED_ERRORS - len(errors)])
+            batch = []
+    if batch:
+        written, batch_errors = await run_in_threadpool(flush, batch, header)
+        imported += written
+        error_count += len(batch_errors)
+        errors.extend(batch_errors[: MAX_REPORTED_ERRORS - len(errors)])
+
+    # Bulk writes bypass the per-holding deltas; recompute this user's header
+    if imported:
+
+        def rebuild():
+            rebuild_summaries(db, [user_id])
+            publish(db, "holdings_added", {"tickers": sorted(tickers)})
+            db.commit()
+            sector_aggregator.add_tickers(db, tickers)
+
+        await run_in_threadpool(rebuild)
+
+    return {
+        "status": "ok" if not error_count else "partial",
+        "rows": rows_seen,
+        "imported": imported,
+        "error_count": error_count,
+        "errors": errors,
+    }
@@ -0,0 +1,61 @@
+# app/manage.py
+"""
+Deploy-time commands, so workers can start with BOOTSTRAP_ON_STARTUP=false:
+
+    python -m app.manage migrate
+    python -m app.manage seed
+    python -m app.manage rebuild-summaries
+    python -m app.manage retention
+"""
+
+import argparse
+
+from app import coordination, lifecycle
+
+
+def rebuild_summaries():
+    from app.database import SessionLocal
+    from app.portfolio import rebuild_summaries as rebuild
+
+    db = SessionLocal()
+    try:
+        rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def retention():
+    from app.retention import retention_job
+
+    if not retention_job():
+        print("⏭️ Retention already running in another worker")
+
+
+def migrate():
+    with coordination.advisory_lock("bootstrap"):
+        lifecycle.migrate()
+
+
+def seed():
+    with coordination.advisory_lock("bootstrap"):
+        lifecycle.seed()
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "seed": seed,
+    "rebuild-summaries": rebuild_summaries,
+    "retention": retention,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
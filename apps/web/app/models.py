@@ -1,4 +1,18 @@
-from sqlalchemy import Column, Integer, String, Float, Date, Boolean, JSON, ForeignKey
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Date,
+    DateTime,
+    Boolean,
+    JSON,
+    ForeignKey,
+    Index,
+    Table,
+    UniqueConstraint,
+    text,
+)
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -15,9 +29,24 @@ class NiftyIndex(Base):
 
 
 class Stock(Base):
+    """A holding: one row per (user_id, ticker)"""
+
     __tablename__ = "stocks"
+    __table_args__ = (
+        UniqueConstraint("user_id", "ticker", name="uq_stocks_user_ticker"),
+        # Covers portfolio valuation for a user without touching the heap
+        Index(
+            "ix_stocks_user_valuation",
+            "user_id",
+            "ticker",
+            postgresql_include=["buy_price", "current_price", "volume"],
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    ticker = Column(String, unique=True, index=True)
+    user_id = Column(
+        String, nullable=False, default="default_user", server_default="default_user"
+    )
+    ticker = Column(String, index=True)
     company_name = Column(String)
     sector = Column(String)
     nifty_group = Column(String)
@@ -31,8 +60,70 @@ class Stock(Base):
     created_at = Column(Date)
 
 
+class PortfolioSummary(Base):
+    """Per-user portfolio header, maintained incrementally (see app/portfolio.py)"""
+
+    __tablename__ = "portfolio_summary"
+    user_id = Column(String, primary_key=True)
+    invested = Column(Float, nullable=False, default=0.0, server_default="0")
+    current_value = Column(Float, nullable=False, default=0.0, server_default="0")
+    change_value = Column(Float, nullable=False, default=0.0, server_default="0")
+    holdings = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(Date)
+
+
+class PortfolioSnapshot(Base):
+    """
+    NAV history per user. period is "day", "week" or "month"; week and
+    month rows are rolled up incrementally from the same refreshes.
+    """
+
+    __tablename__ = "portfolio_snapshots"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "period", "period_start", name="uq_portfolio_snapshots_period"
+        ),
+    )
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    period = Column(String, nullable=False)
+    period_start = Column(Date, nullable=False)
+    open_value = Column(Float)
+    high_value = Column(Float)
+    low_value = Column(Float)
+    close_value = Column(Float)
+    invested = Column(Float)
+    change_value = Column(Float)
+    samples = Column(Integer, default=1)
+    updated_at = Column(Date)
+
+
+class StockPrice(Base):
+    """One closing price per ticker per day, appended on every market refresh"""
+
+    __tablename__ = "stock_prices"
+    __table_args__ = (
+        UniqueConstraint("ticker", "price_date", name="uq_stock_prices_ticker_date"),
+    )
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    ticker = Column(String, index=True)
+    price_date = Column(Date)
+    close = Column(Float)
+    volume = Column(Integer, nullable=True)
+    created_at = Column(Date)
+
+
 class StockRecommendation(Base):
     __tablename__ = "stock_recommendations"
+    __table_args__ = (
+        # Latest metadata per ticker for the recommender's universe
+        Index(
+            "ix_stock_recommendations_ticker_latest",
+            "ticker",
+            text("id DESC"),
+            postgresql_include=["company_name", "sector", "current_price"],
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     ticker = Column(String)
     company_name = Column(String)
@@ -45,7 +136,8 @@ class StockRecommendation(Base):
     reasons = Column(String)
     analysis_type = Column(String)
     alert_time = Column(String)
-    recommendation_date = Column(Date)
+    recommendation_date = Column(Date, index=True)
+    # Cleared by the retention job once the timeframe has elapsed
     is_active = Column(Boolean, default=True)
     created_at = Column(Date)
 
@@ -53,7 +145,7 @@ class StockRecommendation(Base):
 class MarketAnalysis(Base):
     __tablename__ = "market_analysis"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    analysis_date = Column(Date)
+    analysis_date = Column(Date, index=True)
     bullish_sentiment = Column(Float)
     bearish_sentiment = Column(Float)
     market_trend = Column(String)
@@ -74,7 +166,7 @@ class TechnicalIndicator(Base):
     bollinger_lower = Column(String)
     support_level = Column(String)
     resistance_level = Column(String)
-    analysis_date = Column(Date)
+    analysis_date = Column(Date, index=True)
     created_at = Column(Date)
 
 
@@ -91,13 +183,27 @@ class SectorPerformance(Base):
 
 class UserPreferences(Base):
     __tablename__ = "user_preferences"
+    __table_args__ = (
+        # Fan-out only ever reads the users who opted in to a slot; NULL is
+        # the column default (on), as in app.preferences
+        Index(
+            "ix_user_preferences_morning_on",
+            "user_id",
+            postgresql_where=text("morning_alerts_enabled IS NOT FALSE"),
+        ),
+        Index(
+            "ix_user_preferences_afternoon_on",
+            "user_id",
+            postgresql_where=text("afternoon_alerts_enabled IS NOT FALSE"),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(String, index=True)
+    user_id = Column(String, unique=True, index=True, nullable=False)
     morning_alerts_enabled = Column(Boolean, default=True)
     afternoon_alerts_enabled = Column(Boolean, default=True)
     push_notifications_enabled = Column(Boolean, default=True)
     email_notifications_enabled = Column(Boolean, default=True)
-    preferred_sectors = Column(String)
+    preferred_sectors = Column(String)  # comma-separated, NULL = all sectors
     risk_tolerance = Column(String)
     created_at = Column(Date)
     updated_at = Column(Date)
@@ -105,12 +211,120 @@ class UserPreferences(Base):
 
 class NotificationHistory(Base):
     __tablename__ = "notification_history"
+    __table_args__ = (
+        # Keyset pagination over live rows; NULL sent_at sorts as the oldest
+        # day (same expression as app.notifications.SENT_KEY)
+        Index(
+            "ix_notification_history_user_sent_key",
+            "user_id",
+            text("(COALESCE(sent_at, CAST('0001-01-01' AS DATE))) DESC"),
+            text("id DESC"),
+            postgresql_where=text("archived_at IS NULL"),
+        ),
+        # Unread badge counts only touch unread rows
+        Index(
+            "ix_notification_history_unread",
+            "user_id",
+            postgresql_where=text("read_at IS NULL AND archived_at IS NULL"),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(String, index=True)
     notification_type = Column(String)
     title = Column(String)
     message = Column(String)
     ticker = Column(String, nullable=True)
-    sent_at = Column(Date)
+    sent_at = Column(Date, index=True)
     read_at = Column(Date)
+    archived_at = Column(Date, nullable=True)  # hidden from history once set
     created_at = Column(Date)
+
+
+class PriceAlert(Base):
+    """Notify user_id once when ticker crosses threshold in the given direction"""
+
+    __tablename__ = "price_alerts"
+    __table_args__ = (
+        # The alert engine only ever loads armed alerts
+        Index(
+            "ix_price_alerts_active_ticker",
+            "ticker",
+            postgresql_where=text("is_active"),
+        ),
+    )
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(String, index=True, nullable=False)
+    ticker = Column(String, nullable=False)
+    threshold = Column(Float, nullable=False)
+    direction = Column(String, nullable=False)  # "above" or "below"
+    is_active = Column(Boolean, default=True, nullable=False)
+    triggered_at = Column(Date, nullable=True)
+    triggered_price = Column(Float, nullable=True)
+    created_at = Column(Date)
+
+
+class DataVersion(Base):
+    """Per-table write counter; caches key on it instead of scanning the table"""
+
+    __tablename__ = "data_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class JobRun(Base):
+    """Last completed run of a scheduled job, shared by every worker"""
+
+    __tablename__ = "job_runs"
+    name = Column(String, primary_key=True)
+    last_run_at = Column(DateTime(timezone=True))
+
+
+class SeedManifest(Base):
+    """Seed files already loaded, keyed by file name with a content checksum"""
+
+    __tablename__ = "seed_manifest"
+    filename = Column(String, primary_key=True)
+    table_name = Column(String)
+    checksum = Column(String)
+    rows = Column(Integer)
+    loaded_at = Column(Date)
+
+
+class MarketSentimentDaily(Base):
+    """One row per day rolled up from market_analysis, kept after the raw rows age out"""
+
+    __tablename__ = "market_sentiment_daily"
+    analysis_date = Column(Date, primary_key=True)
+    samples = Column(Integer)
+    bullish_avg = Column(Float)
+    bearish_avg = Column(Float)
+    fear_greed_avg = Column(Float)
+    fear_greed_min = Column(Float)
+    fear_greed_max = Column(Float)
+    market_trend = Column(String)  # last reading of the day
+    updated_at = Column(Date)
+
+
+def _archive_table(source: Table) -> Table:
+    """Same columns as `source` plus archived_on; indexed only for the TTL purge"""
+    return Table(
+        f"{source.name}_archive",
+        Base.metadata,
+        *(
+            Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False)
+            for c in source.columns
+        ),
+        Column("archived_on", Date, index=True),
+    )
+
+
+# Hot table name -> archive table, filled by app.retention
+archive_tables = {
+    model.__tablename__: _archive_table(model.__table__)
+    for model in (
+        MarketAnalysis,
+        TechnicalIndicator,
+        StockRecommendation,
+        NotificationHistory,
+    )
+}
@@ -0,0 +1,266 @@
+# app/notifications.py
+"""
+Notification fan-out and history reads.
+
+Alerts are written for every eligible user with one INSERT ... SELECT
+over user_preferences, so the cost is a few statements whatever the
+number of users. History is paged with keyset cursors on (sent_at, id),
+with a NULL sent_at treated as the oldest day; sent_at is a date, so id
+orders rows within a day. Bulk read/archive/delete actions are single
+set-based statements.
+"""
+
+import base64
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, String, delete, func, literal, literal_column, or_
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.dialects.postgresql import array
+
+from .database import SessionLocal
+from .models import NotificationHistory, UserPreferences
+
+
+def _normalize(sector: str) -> str:
+    return "".join((sector or "").split()).lower()
+
+
+def _sector_filter(sectors: Iterable[str]):
+    """Users with no preference, or whose preferred_sectors overlap the picks"""
+    wanted = sorted({_normalize(s) for s in sectors if s})
+    prefs = UserPreferences.preferred_sectors
+    no_preference = or_(prefs.is_(None), func.trim(prefs) == "")
+    if not wanted:
+        return no_preference
+    # "Banking, IT" -> {banking,it}, compared against the picks the same way
+    user_sectors = func.string_to_array(
+        func.lower(func.regexp_replace(prefs, r"\s+", "", "g")), ","
+    )
+    return or_(
+        no_preference,
+        user_sectors.op("&&")(array(wanted, type_=String)),
+    )
+
+
+def fan_out(
+    db,
+    alert_time: str,
+    title: str,
+    message: str,
+    sectors: Optional[Iterable[str]] = None,
+    notification_type: str = "stock_recommendation",
+    ticker: Optional[str] = None,
+) -> int:
+    """
+    Insert one notification per user who enabled push notifications and
+    this alert slot and (when sectors are given) prefers at least one of
+    them. Returns the number of notifications written.
+    """
+    enabled = (
+        UserPreferences.morning_alerts_enabled
+        if alert_time == "10_AM"
+        else UserPreferences.afternoon_alerts_enabled
+    )
+    today = date.today()
+    source = select(
+        UserPreferences.user_id,
+        literal(notification_type),
+        literal(title),
+        literal(message),
+        literal(ticker, type_=String),
+        literal(today),
+        literal(today),
+    ).where(
+        # NULL means the column default (on), as in app.preferences; the
+        # slot test matches the partial index predicate
+        enabled.is_not(False),
+        UserPreferences.push_notifications_enabled.is_not(False),
+    )
+    if sectors is not None:
+        source = source.where(_sector_filter(sectors))
+
+    result = db.execute(
+        NotificationHistory.__table__.insert().from_select(
+            [
+                "user_id",
+                "notification_type",
+                "title",
+                "message",
+                "ticker",
+                "sent_at",
+                "created_at",
+            ],
+            source,
+        )
+    )
+    return result.rowcount
+
+
+def fan_out_in_background(alert_time: str, title: str, message: str, sectors=None):
+    """BackgroundTasks entry point: own session, runs after the response commit"""
+    db = SessionLocal()
+    try:
+        sent = fan_out(db, alert_time, title, message, sectors=sectors)
+        db.commit()
+        print(f"📣 {title}: notified {sent} users")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Notification fan-out failed: {e}")
+    finally:
+        db.close()
+
+
+# --- history reads ---
+
+NO_SENT_AT = date.min
+# Indexed by ix_notification_history_user_sent_key; keep the two in sync
+SENT_KEY = func.coalesce(
+    NotificationHistory.sent_at, literal_column("CAST('0001-01-01' AS DATE)", Date)
+)
+
+
+def encode_cursor(sent_at: Optional[date], notification_id: int) -> str:
+    raw = f"{(sent_at or NO_SENT_AT).isoformat()}|{notification_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """Raises ValueError for anything that isn't a cursor we issued"""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    sent_at, _, notification_id = (
+        base64.urlsafe_b64decode(padded.encode()).decode().partition("|")
+    )
+    # Cursors issued for NULL sent_at before NO_SENT_AT carried an empty date
+    sent_at = date.fromisoformat(sent_at) if sent_at else NO_SENT_AT
+    return sent_at, int(notification_id)
+
+
+def _row(r) -> dict:
+    return {
+        "id": r.id,
+        "title": r.title,
+        "message": r.message,
+        "notification_type": r.notification_type,
+        "ticker": r.ticker,
+        "sent_at": r.sent_at.isoformat() if r.sent_at else None,
+        "read_at": r.read_at.isoformat() if r.read_at else None,
+    }
+
+
+def history_page(
+    db,
+    user_id: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+) -> dict:
+    """
+    Newest-first page of a user's notifications.
+    - cursor: continue with rows older than this cursor
+    - since: delta sync, rows newer than this cursor (oldest first)
+    Each page is an index range scan, however long the history is.
+    """
+    n = NotificationHistory
+    key = tuple_(SENT_KEY, n.id)
+    q = select(
+        n.id, n.title, n.message, n.notification_type, n.ticker, n.sent_at, n.read_at
+    ).where(n.user_id == user_id, n.archived_at.is_(None))
+    if since:
+        q = q.where(key > tuple_(*decode_cursor(since))).order_by(
+            SENT_KEY.asc(), n.id.asc()
+        )
+    else:
+        if cursor:
+            q = q.where(key < tuple_(*decode_cursor(cursor)))
+        q = q.order_by(SENT_KEY.desc(), n.id.desc())
+
+    rows = db.execute(q.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if since:
+        # Caller keeps polling from the newest row it has seen
+        sync_cursor = encode_cursor(rows[-1].sent_at, rows[-1].id) if rows else since
+        next_cursor = None
+    else:
+        next_cursor = encode_cursor(rows[-1].sent_at, rows[-1].id) if has_more else None
+        sync_cursor = encode_cursor(rows[0].sent_at, rows[0].id) if rows else None
+    return {
+        "history": [_row(r) for r in rows],
+        "next_cursor": next_cursor,
+        "sync_cursor": sync_cursor,
+        "has_more": has_more,
+    }
+
+
+def unread_count(db, user_id: str) -> int:
+    """Counted from the partial index on unread rows"""
+    return db.execute(
+        select(func.count())
+        .select_from(NotificationHistory)
+        .where(
+            NotificationHistory.user_id == user_id,
+            NotificationHistory.read_at.is_(None),
+            NotificationHistory.archived_at.is_(None),
+        )
+    ).scalar_one()
+
+
+# --- bulk actions ---
+
+
+def _targets(
+    user_id: str,
+    ids: Optional[List[int]],
+    before: Optional[str],
+    live_only: bool = True,
+) -> list:
+    """
+    WHERE clauses for a bulk action: the user's own live rows, narrowed to
+    `ids` and/or to rows at or before the cursor `before` (inclusive, so a
+    client can pass the sync_cursor of what it has displayed).
+    """
+    n = NotificationHistory
+    clauses = [n.user_id == user_id]
+    if live_only:
+        clauses.append(n.archived_at.is_(None))
+    if ids is not None:
+        clauses.append(n.id.in_(ids))
+    if before:
+        clauses.append(tuple_(SENT_KEY, n.id) <= tuple_(*decode_cursor(before)))
+    return clauses
+
+
+def mark_read(
+    db, user_id: str, ids: Optional[List[int]] = None, before: Optional[str] = None
+) -> int:
+    """Mark unread notifications as read; returns how many changed"""
+    result = db.execute(
+        update(NotificationHistory)
+        .where(*_targets(user_id, ids, before), NotificationHistory.read_at.is_(None))
+        .values(read_at=date.today())
+    )
+    return result.rowcount
+
+
+def archive(
+    db, user_id: str, ids: Optional[List[int]] = None, before: Optional[str] = None
+) -> int:
+    result = db.execute(
+        update(NotificationHistory)
+        .where(*_targets(user_id, ids, before))
+        .values(archived_at=date.today())
+    )
+    return result.rowcount
+
+
+def delete_notifications(
+    db, user_id: str, ids: Optional[List[int]] = None, before: Optional[str] = None
+) -> int:
+    result = db.execute(
+        delete(NotificationHistory).where(
+            *_targets(user_id, ids, before, live_only=False)
+        )
+    )
+    return result.rowcount
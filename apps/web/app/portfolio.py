@@ -0,0 +1,378 @@
+# app/portfolio.py
+"""
+Portfolio valuation and the per-user portfolio_summary table.
+
+Holdings are fetched as plain column tuples in one query (joined with the
+last close before today for day change) and valued in a single NumPy
+pass: per-holding P&L, totals, day change and allocation.
+
+portfolio_summary holds one header row per user. It is never recomputed
+on the request path: holding writes apply their delta, and price ticks
+apply a per-user delta in one set-based UPDATE.
+"""
+
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import Float, Numeric, String, and_, case, cast, column, func
+from sqlalchemy import select, true, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import PortfolioSummary, Stock, StockPrice
+
+SORT_KEYS = {
+    "ticker",
+    "company_name",
+    "sector",
+    "invested_amount",
+    "current_value",
+    "change_value",
+    "change_percent",
+    "day_change",
+    "weight_percent",
+}
+
+
+def _holdings_query(user_id: str):
+    # LATERAL: one backward probe of uq_stock_prices_ticker_date per holding
+    previous_close = (
+        select(StockPrice.close)
+        .where(StockPrice.ticker == Stock.ticker, StockPrice.price_date < date.today())
+        .order_by(StockPrice.price_date.desc())
+        .limit(1)
+        .lateral("previous_close")
+    )
+    return (
+        select(
+            Stock.id,
+            Stock.ticker,
+            Stock.company_name,
+            Stock.sector,
+            Stock.nifty_group,
+            Stock.buy_price,
+            Stock.current_price,
+            Stock.volume,
+            Stock.market_cap,
+            Stock.last_updated,
+            previous_close.c.close.label("previous_close"),
+        )
+        .outerjoin(previous_close, true())
+        .where(Stock.user_id == user_id)
+    )
+
+
+def _floats(rows, i) -> np.ndarray:
+    return np.array([r[i] for r in rows], dtype=float)  # None -> nan
+
+
+def _allocation(keys: np.ndarray, values: np.ndarray, total: float) -> list:
+    labels, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(labels))
+    counts = np.bincount(inverse, minlength=len(labels))
+    order = np.argsort(-sums, kind="stable")
+    return [
+        {
+            "name": str(labels[i]),
+            "current_value": round(float(sums[i]), 2),
+            "weight_percent": round(float(sums[i] / total * 100), 2) if total else 0,
+            "holdings": int(counts[i]),
+        }
+        for i in order
+    ]
+
+
+def _round(arr: np.ndarray) -> list:
+    return np.round(arr, 2).tolist()
+
+
+def value_portfolio(
+    db,
+    user_id: str = "default_user",
+    sort_by: str = "ticker",
+    order: str = "asc",
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> dict:
+    rows = db.execute(_holdings_query(user_id)).all()
+    n = len(rows)
+
+    buy = _floats(rows, 5)
+    current = _floats(rows, 6)
+    qty = np.nan_to_num(_floats(rows, 7))
+    prev_close = _floats(rows, 10)
+
+    priced = np.isfinite(current)
+    # An unpriced holding is carried at cost so it doesn't distort P&L
+    mark = np.where(priced, current, buy)
+    invested = np.nan_to_num(buy * qty)
+    value = np.nan_to_num(mark * qty)
+    change = value - invested
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change_pct = np.where(invested != 0, change / invested * 100, 0.0)
+    has_prev = np.isfinite(prev_close) & priced
+    day_change = np.where(has_prev, (current - prev_close) * qty, 0.0)
+    prev_value = np.where(has_prev, prev_close * qty, value)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        day_pct = np.where(prev_value != 0, day_change / prev_value * 100, 0.0)
+
+    total_invested = float(invested.sum())
+    total_current = float(value.sum())
+    total_change = total_current - total_invested
+    total_day_change = float(day_change.sum())
+    total_prev_value = float(prev_value.sum())
+    weight = value / total_current * 100 if total_current else np.zeros(n)
+
+    # --- sort + paginate on the arrays ---
+    text_cols = {"ticker": 1, "company_name": 2, "sector": 3}
+    numeric = {
+        "invested_amount": invested,
+        "current_value": value,
+        "change_value": change,
+        "change_percent": change_pct,
+        "day_change": day_change,
+        "weight_percent": weight,
+    }
+    if sort_by in numeric:
+        idx = np.argsort(numeric[sort_by], kind="stable")
+    else:
+        col = text_cols.get(sort_by, 1)
+        idx = np.argsort(
+            np.array([(r[col] or "").lower() for r in rows], dtype=object),
+            kind="stable",
+        )
+    if order == "desc":
+        idx = idx[::-1]
+    page = idx[offset : offset + limit] if limit is not None else idx[offset:]
+
+    cols = {
+        "buy_price": _round(np.nan_to_num(buy)),
+        "current_price": _round(np.nan_to_num(current)),
+        "invested_amount": _round(invested),
+        "current_value": _round(value),
+        "change_value": _round(change),
+        "change_percent": _round(change_pct),
+        "day_change": _round(day_change),
+        "day_change_percent": _round(day_pct),
+        "weight_percent": _round(weight),
+    }
+    data = []
+    for i in page.tolist():
+        r = rows[i]
+        item = {
+            "id": r.id,
+            "ticker": r.ticker,
+            "company_name": r.company_name,
+            "sector": r.sector,
+            "nifty_group": r.nifty_group,
+            "volume": r.volume,
+            "market_cap": r.market_cap,
+            "last_updated": r.last_updated.isoformat() if r.last_updated else None,
+            "is_positive": bool(change[i] >= 0) and bool(priced[i]),
+        }
+        for name, values in cols.items():
+            item[name] = values[i]
+        data.append(item)
+
+    sectors = np.array([(r.sector or "Unknown").strip() for r in rows], dtype=object)
+    groups = np.array(
+        [(r.nifty_group or "Unknown").strip() for r in rows], dtype=object
+    )
+
+    return {
+        "data": data,
+        "total_invested": round(total_invested, 2),
+        "total_current": round(total_current, 2),
+        "total_change": round(total_change, 2),
+        "total_change_percent": (
+            round(total_change / total_invested * 100, 2) if total_invested else 0
+        ),
+        "total_day_change": round(total_day_change, 2),
+        "day_change_percent": (
+            round(total_day_change / total_prev_value * 100, 2)
+            if total_prev_value
+            else 0
+        ),
+        # Invested-weighted average of holding returns; equals total return
+        "weighted_return_percent": (
+            round(float((invested * change_pct).sum() / total_invested), 2)
+            if total_invested
+            else 0
+        ),
+        "allocation": {
+            "sector": _allocation(sectors, value, total_current) if n else [],
+            "nifty_group": _allocation(groups, value, total_current) if n else [],
+        },
+        "pagination": {
+            "total": n,
+            "offset": offset,
+            "limit": limit,
+            "sort_by": sort_by,
+            "order": order,
+        },
+    }
+
+
+# --- portfolio_summary maintenance ---
+
+
+def holding_value(buy_price, current_price, volume) -> tuple:
+    """(invested, current value) of one holding, valued like value_portfolio"""
+    qty = volume or 0
+    invested = (buy_price or 0) * qty
+    mark = current_price if current_price is not None else (buy_price or 0)
+    return invested, mark * qty
+
+
+def apply_summary_delta(
+    db, user_id: str, invested: float = 0.0, value: float = 0.0, holdings: int = 0
+):
+    """Add a delta to a user's summary row, creating it on first use"""
+    stmt = pg_insert(PortfolioSummary).values(
+        user_id=user_id,
+        invested=invested,
+        current_value=value,
+        change_value=value - invested,
+        holdings=holdings,
+        updated_at=date.today(),
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PortfolioSummary.user_id],
+            set_={
+                "invested": PortfolioSummary.invested + stmt.excluded.invested,
+                "current_value": PortfolioSummary.current_value
+                + stmt.excluded.current_value,
+                "change_value": PortfolioSummary.change_value
+                + stmt.excluded.change_value,
+                "holdings": PortfolioSummary.holdings + stmt.excluded.holdings,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    )
+
+
+def apply_price_ticks(db, prices: Dict[str, float]) -> int:
+    """
+    Push new prices into every holding of those tickers and move each
+    affected user's summary by the value delta. Two statements regardless
+    of how many users hold the tickers. Returns the number of holdings updated.
+    """
+    if not prices:
+        return 0
+    ticks = values(column("ticker", String), column("price", Float), name="ticks").data(
+        list(prices.items())
+    )
+
+    qty = func.coalesce(Stock.volume, 0)
+    old_mark = func.coalesce(Stock.current_price, Stock.buy_price, 0)
+    deltas = (
+        select(
+            Stock.user_id,
+            func.sum(qty * (ticks.c.price - old_mark)).label("delta"),
+        )
+        .join(ticks, ticks.c.ticker == Stock.ticker)
+        .group_by(Stock.user_id)
+        .subquery()
+    )
+    db.execute(
+        update(PortfolioSummary)
+        .where(PortfolioSummary.user_id == deltas.c.user_id)
+        .values(
+            current_value=PortfolioSummary.current_value + deltas.c.delta,
+            change_value=PortfolioSummary.change_value + deltas.c.delta,
+            updated_at=date.today(),
+        )
+    )
+
+    has_cost = and_(Stock.buy_price > 0, Stock.volume > 0)
+    result = db.execute(
+        update(Stock)
+        .where(Stock.ticker == ticks.c.ticker)
+        .values(
+            current_price=ticks.c.price,
+            change_value=case(
+                (has_cost, (ticks.c.price - Stock.buy_price) * Stock.volume),
+                else_=Stock.change_value,
+            ),
+            change_percent=case(
+                (
+                    has_cost,
+                    cast(
+                        func.round(
+                            cast(
+                                (ticks.c.price - Stock.buy_price)
+                                / Stock.buy_price
+                                * 100,
+                                Numeric,
+                            ),
+                            2,
+                        ),
+                        Float,
+                    ),
+                ),
+                else_=Stock.change_percent,
+            ),
+            last_updated=date.today(),
+        )
+    )
+    return result.rowcount
+
+
+def rebuild_summaries(db, user_ids: Optional[Iterable[str]] = None):
+    """
+    Recompute summary rows from holdings. Only needed after bulk loads or
+    to repair drift; the request path relies on the incremental updates.
+    """
+    qty = func.coalesce(Stock.volume, 0)
+    invested = func.sum(func.coalesce(Stock.buy_price, 0) * qty)
+    value = func.sum(func.coalesce(Stock.current_price, Stock.buy_price, 0) * qty)
+    source = select(
+        Stock.user_id,
+        invested,
+        value,
+        value - invested,
+        func.count(Stock.id),
+        func.current_date(),
+    ).group_by(Stock.user_id)
+    if user_ids is not None:
+        source = source.where(Stock.user_id.in_(list(user_ids)))
+    stmt = pg_insert(PortfolioSummary).from_select(
+        [
+            "user_id",
+            "invested",
+            "current_value",
+            "change_value",
+            "holdings",
+            "updated_at",
+        ],
+        source,
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PortfolioSummary.user_id],
+            set_={
+                "invested": stmt.excluded.invested,
+                "current_value": stmt.excluded.current_value,
+                "change_value": stmt.excluded.change_value,
+                "holdings": stmt.excluded.holdings,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    )
+
+
+def get_summary(db, user_id: str) -> dict:
+    """Portfolio header for one user: a primary-key lookup"""
+    row = db.get(PortfolioSummary, user_id)
+    invested = row.invested if row else 0.0
+    change = row.change_value if row else 0.0
+    return {
+        "user_id": user_id,
+        "total_invested": round(invested, 2),
+        "total_current": round(row.current_value, 2) if row else 0.0,
+        "total_change": round(change, 2),
+        "total_change_percent": round(change / invested * 100, 2) if invested else 0,
+        "holdings": row.holdings if row else 0,
+        "updated_at": row.updated_at.isoformat() if row and row.updated_at else None,
+    }
@@ -0,0 +1,97 @@
+# app/preferences.py
+"""
+User notification preferences behind a small per-process LRU cache.
+
+Reads never write: a user without a row gets the defaults. The row is
+created on the first update through an upsert on the unique user_id.
+Updates invalidate the local cache after commit and broadcast
+"preferences_updated" so other workers drop their copy too. Every
+invalidation bumps a generation counter; a read that raced one doesn't
+store what it fetched, so a pre-update row can't refill the cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.coordination import publish
+
+from .models import UserPreferences
+
+CACHE_SIZE = int(os.getenv("PREFERENCES_CACHE_SIZE", "10000"))
+
+FIELDS = (
+    "push_notifications_enabled",
+    "morning_alerts_enabled",
+    "afternoon_alerts_enabled",
+)
+# Mirrors the column defaults on UserPreferences
+DEFAULTS = {field: True for field in FIELDS}
+
+_cache: "OrderedDict[str, dict]" = OrderedDict()
+_lock = threading.Lock()
+_generation = 0
+
+
+def get_preferences(db, user_id: str) -> dict:
+    with _lock:
+        prefs = _cache.get(user_id)
+        if prefs is not None:
+            _cache.move_to_end(user_id)
+            return prefs
+        generation = _generation
+
+    row = db.execute(
+        select(*(getattr(UserPreferences, f) for f in FIELDS)).where(
+            UserPreferences.user_id == user_id
+        )
+    ).first()
+    prefs = (
+        {f: (v if v is not None else DEFAULTS[f]) for f, v in zip(FIELDS, row)}
+        if row
+        else dict(DEFAULTS)
+    )
+    with _lock:
+        if generation != _generation:
+            return prefs  # invalidated while we read; may be stale
+        _cache[user_id] = prefs
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prefs
+
+
+def update_preferences(db, user_id: str, changes: dict):
+    """
+    Upsert the user's row with the non-None fields of `changes`.
+    The caller commits, then calls invalidate(user_id).
+    """
+    changes = {f: changes[f] for f in FIELDS if changes.get(f) is not None}
+    stmt = pg_insert(UserPreferences).values(
+        user_id=user_id,
+        **{**DEFAULTS, **changes},
+        created_at=date.today(),
+        updated_at=date.today(),
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[UserPreferences.user_id],
+            set_={**changes, "updated_at": stmt.excluded.updated_at},
+        )
+    )
+    publish(db, "preferences_updated", {"user_id": user_id})
+
+
+def invalidate(user_id: Optional[str] = None):
+    """Drop one user's cached preferences, or all of them"""
+    global _generation
+    with _lock:
+        _generation += 1
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
@@ -0,0 +1,429 @@
+# app/recommender.py
+"""
+Local, deterministic recommendation engine.
+
+The whole ticker universe is ranked from stored prices and technical
+indicators with vectorized NumPy. The LLM is only asked to phrase the
+`reasons` for the picks that come out of here.
+"""
+
+import re
+import warnings
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from .models import Stock, StockPrice, StockRecommendation, TechnicalIndicator
+
+LOOKBACK_DAYS = 300
+MAX_PICKS = 20  # upper bound for generate_picks(limit=...) from the API
+DEFAULT_DAILY_VOL = 0.02
+
+# Strategy weights applied to cross-sectional z-scores of each signal
+STRATEGIES = {
+    # Morning: momentum, breakouts, trend confirmation
+    "10_AM": {
+        "analysis_type": "momentum",
+        "weights": {
+            "momentum_5": 0.30,
+            "momentum_20": 0.25,
+            "crossover": 0.20,
+            "rsi_regime": 0.25,
+            "reversion": 0.0,
+        },
+    },
+    # Afternoon: swing trades and reversals within the prevailing trend
+    "2_PM": {
+        "analysis_type": "swing",
+        "weights": {
+            "momentum_5": -0.10,
+            "momentum_20": 0.10,
+            "crossover": 0.20,
+            "rsi_regime": 0.10,
+            "reversion": 0.50,
+        },
+    },
+}
+
+BUY_THRESHOLD = 0.25
+SELL_THRESHOLD = -0.25
+
+# Trading days per unit of a timeframe label
+TIMEFRAME_UNIT_DAYS = {"day": 1, "week": 5, "month": 21, "year": 252}
+# "1-3 Days", "2-8 weeks", "6 to 9 Months", "1 Year": the upper bound counts
+_TIMEFRAME = re.compile(
+    r"(\d+)(?:\s*(?:-|–|to)\s*(\d+))?\s*(day|week|month|year)s?\b", re.I
+)
+
+
+def realistic_timeframe(
+    alert_time: str, recommendation_type: str, confidence: float
+) -> str:
+    """
+    Pick a timeframe for the recommendation.
+    - Intraday alerts -> very short timeframes
+    - High confidence BUY -> longer hold times
+    - Low confidence -> shorter hold times
+    `confidence` is 0-1. Within each bucket the choice depends on the
+    confidence so the same inputs always give the same timeframe.
+    """
+
+    def pick(options, lo, hi):
+        span = (confidence - lo) / (hi - lo) if hi > lo else 0
+        return options[min(len(options) - 1, max(0, int(span * len(options))))]
+
+    if alert_time == "10_AM":  # Morning alerts → short-term
+        return pick(["1-3 Days", "1 Week"], 0.6, 0.95)
+
+    if recommendation_type == "BUY":
+        if confidence > 0.85:
+            return pick(["6-12 Months", "1 Year"], 0.85, 0.95)
+        elif confidence > 0.75:
+            return pick(["1-3 Months", "3-6 Months"], 0.75, 0.85)
+        else:
+            return pick(["1-3 Weeks", "1-3 Months"], 0.6, 0.75)
+
+    if recommendation_type == "SELL":
+        return pick(["1-3 Days", "1 Week", "1-2 Weeks"], 0.6, 0.95)
+
+    # HOLD case
+    return pick(["2-4 Weeks", "1-3 Months"], 0.6, 0.95)
+
+
+def timeframe_days(timeframe, default: Optional[int] = 20) -> Optional[int]:
+    """
+    Trading-day horizon for a timeframe label, from the upper end of its
+    range ("6-9 Months" -> 189). `default` for anything that doesn't
+    parse, including NULL/NaN.
+    """
+    if not isinstance(timeframe, str):
+        return default
+    m = _TIMEFRAME.search(timeframe)
+    if not m:
+        return default
+    upper = int(m.group(2) or m.group(1))
+    return upper * TIMEFRAME_UNIT_DAYS[m.group(3).lower()]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _zscore(x: np.ndarray) -> np.ndarray:
+    mean = np.nanmean(x) if np.isfinite(x).any() else 0.0
+    std = np.nanstd(x) if np.isfinite(x).any() else 0.0
+    z = (x - mean) / std if std > 0 else np.zeros_like(x)
+    return np.nan_to_num(z, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs along the time axis (axis=1)"""
+    mask = np.isnan(matrix)
+    idx = np.where(~mask, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return matrix[np.arange(matrix.shape[0])[:, None], idx]
+
+
+def load_universe(db, lookback_days: int = LOOKBACK_DAYS) -> dict:
+    """
+    Load everything the ranker needs in a handful of queries:
+    ticker metadata, latest technical indicators and a
+    (tickers x days) close price matrix.
+    """
+    meta: Dict[str, dict] = {}
+    # Latest recommendation per ticker: DISTINCT ON walks
+    # ix_stock_recommendations_ticker_latest, an index-only scan with no sort
+    for ticker, company, sector, price in db.execute(
+        select(
+            StockRecommendation.ticker,
+            StockRecommendation.company_name,
+            StockRecommendation.sector,
+            StockRecommendation.current_price,
+        )
+        .where(StockRecommendation.ticker.is_not(None))
+        .distinct(StockRecommendation.ticker)
+        .order_by(StockRecommendation.ticker, StockRecommendation.id.desc())
+    ):
+        if ticker:
+            meta[ticker] = {"company_name": company, "sector": sector, "price": price}
+    # Holdings data wins over whatever older recommendations said
+    for ticker, company, sector, price in db.execute(
+        select(Stock.ticker, Stock.company_name, Stock.sector, Stock.current_price)
+    ):
+        if ticker:
+            meta[ticker] = {"company_name": company, "sector": sector, "price": price}
+
+    indicators: Dict[str, dict] = {}
+    for ti in db.execute(
+        select(
+            TechnicalIndicator.ticker,
+            TechnicalIndicator.rsi_14,
+            TechnicalIndicator.moving_avg_50,
+            TechnicalIndicator.moving_avg_200,
+            TechnicalIndicator.support_level,
+            TechnicalIndicator.resistance_level,
+        )
+        .distinct(TechnicalIndicator.ticker)
+        .order_by(
+            TechnicalIndicator.ticker,
+            TechnicalIndicator.analysis_date.desc(),
+            TechnicalIndicator.id.desc(),
+        )
+    ):
+        if ti.ticker:
+            indicators[ti.ticker] = {
+                "rsi": _to_float(ti.rsi_14),
+                "ma50": _to_float(ti.moving_avg_50),
+                "ma200": _to_float(ti.moving_avg_200),
+                "support": _to_float(ti.support_level),
+                "resistance": _to_float(ti.resistance_level),
+            }
+
+    since = date.today() - timedelta(days=lookback_days)
+    price_rows = db.execute(
+        select(StockPrice.ticker, StockPrice.price_date, StockPrice.close).where(
+            StockPrice.price_date >= since
+        )
+    ).all()
+
+    tickers = sorted(
+        set(meta) | set(indicators) | {r.ticker for r in price_rows if r.ticker}
+    )
+    dates = sorted({r.price_date for r in price_rows})
+    prices = np.full((len(tickers), len(dates)), np.nan)
+    if price_rows:
+        t_idx = {t: i for i, t in enumerate(tickers)}
+        d_idx = {d: j for j, d in enumerate(dates)}
+        rows = np.fromiter(
+            (t_idx[r.ticker] for r in price_rows if r.ticker), dtype=np.int64
+        )
+        cols = np.fromiter(
+            (d_idx[r.price_date] for r in price_rows if r.ticker), dtype=np.int64
+        )
+        vals = np.fromiter(
+            (_to_float(r.close) for r in price_rows if r.ticker), dtype=float
+        )
+        prices[rows, cols] = vals
+        prices = _ffill(prices)
+
+    return {
+        "tickers": tickers,
+        "meta": meta,
+        "indicators": indicators,
+        "prices": prices,
+    }
+
+
+def compute_signals(universe: dict) -> Dict[str, np.ndarray]:
+    """Vectorized per-ticker signals; one array entry per ticker"""
+    # Tickers without history produce all-NaN slices; they fall back to
+    # stored indicators below, so the "empty slice" warnings are noise
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return _compute_signals(universe)
+
+
+def _compute_signals(universe: dict) -> Dict[str, np.ndarray]:
+    tickers = universe["tickers"]
+    prices = universe["prices"]
+    n, t = prices.shape
+    meta = universe["meta"]
+    ind = universe["indicators"]
+
+    def stored(key):
+        return np.array([ind.get(tk, {}).get(key, np.nan) for tk in tickers])
+
+    stored_price = np.array(
+        [_to_float(meta.get(tk, {}).get("price")) for tk in tickers]
+    )
+    last = prices[:, -1] if t else np.full(n, np.nan)
+    last = np.where(np.isfinite(last), last, stored_price)
+
+    def lagged(k):
+        if t <= k:
+            return np.full(n, np.nan)
+        return prices[:, -1 - k]
+
+    momentum_5 = last / lagged(5) - 1
+    momentum_20 = last / lagged(20) - 1
+
+    # RSI(14) on the price history, same simple-average form as technical.rsi
+    if t > 14:
+        delta = np.diff(prices[:, -15:], axis=1)
+        up = np.nanmean(np.clip(delta, 0, None), axis=1)
+        down = np.nanmean(np.clip(-delta, 0, None), axis=1)
+        rsi = 100 - 100 / (1 + up / (down + 1e-8))
+    else:
+        rsi = np.full(n, np.nan)
+    rsi = np.where(np.isfinite(rsi), rsi, stored("rsi"))
+
+    def moving_avg(window, key):
+        if t >= window:
+            ma = np.nanmean(prices[:, -window:], axis=1)
+        else:
+            ma = np.full(n, np.nan)
+        return np.where(np.isfinite(ma), ma, stored(key))
+
+    ma50 = moving_avg(50, "ma50")
+    ma200 = moving_avg(200, "ma200")
+    crossover = (ma50 - ma200) / ma200
+
+    if t > 2:
+        log_ret = np.diff(np.log(prices[:, -61:]), axis=1)
+        vol = np.nanstd(log_ret, axis=1)
+    else:
+        vol = np.full(n, np.nan)
+    vol = np.where(np.isfinite(vol) & (vol > 0), vol, DEFAULT_DAILY_VOL)
+
+    # RSI regime: healthy trend (50-70) is good, overbought/oversold is not
+    rsi_regime = np.select(
+        [rsi >= 75, rsi >= 50, rsi >= 30, rsi < 30],
+        [-1.0, (rsi - 50) / 20, (rsi - 50) / 20, -0.5],
+        default=0.0,
+    )
+    # Swing: oversold names in an uptrend, overbought names in a downtrend
+    deviation = (last - ma50) / ma50
+    reversion = -deviation + np.select(
+        [(rsi < 35) & (crossover > 0), (rsi > 70) & (crossover < 0)],
+        [0.05, -0.05],
+        default=0.0,
+    )
+
+    return {
+        "last": last,
+        "momentum_5": momentum_5,
+        "momentum_20": momentum_20,
+        "rsi": rsi,
+        "ma50": ma50,
+        "ma200": ma200,
+        "crossover": crossover,
+        "volatility": vol,
+        "rsi_regime": rsi_regime,
+        "reversion": reversion,
+    }
+
+
+def score_universe(signals: Dict[str, np.ndarray], alert_time: str) -> dict:
+    """Combine signals into a score, call, confidence (0-1) and target price"""
+    strategy = STRATEGIES.get(alert_time, STRATEGIES["10_AM"])
+    weights = strategy["weights"]
+    raw = sum(w * _zscore(signals[k]) for k, w in weights.items() if w)
+    score = np.tanh(raw / 2)
+
+    call = np.where(
+        score >= BUY_THRESHOLD, "BUY", np.where(score <= SELL_THRESHOLD, "SELL", "HOLD")
+    )
+    confidence = 0.60 + 0.35 * np.clip(np.abs(score), 0, 1)
+
+    direction = np.where(call == "BUY", 1.0, np.where(call == "SELL", -1.0, 0.0))
+    horizon = 5 if alert_time == "10_AM" else 20
+    move = np.clip(signals["volatility"] * np.sqrt(horizon) * np.abs(score), 0, 0.5)
+    target = signals["last"] * (1 + direction * move)
+
+    return {
+        "score": score,
+        "recommendation": call,
+        "confidence": confidence,
+        "target": target,
+        "analysis_type": strategy["analysis_type"],
+    }
+
+
+def diversify(order: np.ndarray, sectors: List[str], limit: int) -> List[int]:
+    """
+    Walk the ranking and take at most one name per sector; if the
+    universe has fewer sectors than `limit`, fill up with the next best.
+    """
+    picks, seen = [], set()
+    for i in order:
+        sector = (sectors[i] or "Unknown").strip().lower()
+        if sector in seen:
+            continue
+        seen.add(sector)
+        picks.append(int(i))
+        if len(picks) == limit:
+            return picks
+    for i in order:
+        if int(i) not in picks:
+            picks.append(int(i))
+            if len(picks) == limit:
+                break
+    return picks
+
+
+def describe_signals(pick: dict) -> str:
+    """Plain-text fallback for `reasons` when no narrative is available"""
+    s = pick["signals"]
+    parts = [f"RSI {s['rsi']:.1f}" if s["rsi"] is not None else None]
+    if s["momentum_20"] is not None:
+        parts.append(f"20-day momentum {s['momentum_20'] * 100:+.1f}%")
+    if s["crossover"] is not None:
+        trend = "above" if s["crossover"] >= 0 else "below"
+        parts.append(f"50-DMA {trend} 200-DMA")
+    parts.append(f"daily volatility {s['volatility'] * 100:.1f}%")
+    summary = ", ".join(p for p in parts if p)
+    return f"{pick['analysis_type'].capitalize()} signal: {summary}."
+
+
+def rank_universe(db, alert_time: str) -> List[dict]:
+    """Score every ticker that has a usable price, best first"""
+    universe = load_universe(db)
+    if not universe["tickers"]:
+        return []
+    signals = compute_signals(universe)
+    scored = score_universe(signals, alert_time)
+
+    usable = np.isfinite(signals["last"]) & (signals["last"] > 0)
+    # BUY/SELL conviction first, strongest absolute score within each
+    strength = np.where(usable, np.abs(scored["score"]), -np.inf)
+    order = np.argsort(-strength, kind="stable")
+    order = order[usable[order]]
+
+    def opt(arr, i, digits=4):
+        v = arr[i]
+        return round(float(v), digits) if np.isfinite(v) else None
+
+    out = []
+    for i in order:
+        tk = universe["tickers"][i]
+        meta = universe["meta"].get(tk, {})
+        confidence = float(scored["confidence"][i])
+        call = str(scored["recommendation"][i])
+        out.append(
+            {
+                "ticker": tk,
+                "company_name": meta.get("company_name") or tk,
+                "sector": meta.get("sector") or "Unknown",
+                "current_price": round(float(signals["last"][i]), 2),
+                "target_price": round(float(scored["target"][i]), 2),
+                "recommendation": call,
+                "confidence_score": round(confidence, 4),
+                "timeframe": realistic_timeframe(alert_time, call, confidence),
+                "analysis_type": scored["analysis_type"],
+                "score": round(float(scored["score"][i]), 4),
+                "signals": {
+                    "rsi": opt(signals["rsi"], i, 2),
+                    "momentum_5": opt(signals["momentum_5"], i),
+                    "momentum_20": opt(signals["momentum_20"], i),
+                    "crossover": opt(signals["crossover"], i),
+                    "volatility": opt(signals["volatility"], i),
+                },
+            }
+        )
+    return out
+
+
+def generate_picks(db, alert_time: str, limit: int = 5) -> List[dict]:
+    """Top `limit` recommendations for an alert slot, sector-diversified"""
+    ranked = rank_universe(db, alert_time)
+    order = np.arange(len(ranked))
+    idx = diversify(order, [r["sector"] for r in ranked], limit)
+    picks = [ranked[i] for i in idx]
+    for p in picks:
+        p["reasons"] = describe_signals(p)
+    return picks
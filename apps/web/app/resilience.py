@@ -0,0 +1,274 @@
+# app/resilience.py
+import asyncio
+import random
+import time
+from collections import deque
+
+# HTTP status codes worth retrying (rate limit, transient server errors)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when the breaker is open and no cached result is available"""
+
+
+class InvalidResponseError(Exception):
+    """Raised when the upstream answered but the payload could not be parsed"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, InvalidResponseError, ConnectionError)):
+        return True
+    code = getattr(exc, "code", None)
+    try:
+        return int(code) in RETRYABLE_STATUS
+    except (TypeError, ValueError):
+        return False
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half_open breaker.
+    - closed: calls flow, consecutive failures are counted
+    - open: calls fail fast until reset_timeout has elapsed
+    - half_open: a single probe call decides whether to close or re-open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        # half_open: let exactly one probe through
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Probe ended without an outcome (e.g. cancelled); allow another"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        retry_in = None
+        if self.state == "open":
+            retry_in = max(
+                0.0, self.reset_timeout - (time.monotonic() - self.opened_at)
+            )
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(retry_in, 2) if retry_in is not None else None,
+        }
+
+
+class LatencyWindow:
+    """Rolling window of successful call latencies (seconds)"""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        k = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[k]
+
+
+class ResilientCaller:
+    """
+    Wraps an async upstream call with:
+    - a per-attempt timeout, and an overall deadline covering every
+      attempt and backoff of one call
+    - jittered exponential backoff for retryable errors
+    - a circuit breaker that serves the last good result while open
+    - optional hedging: a duplicate request is fired once the attempt
+      runs longer than the configured latency percentile
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 20.0,
+        deadline: float = None,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = 20,
+        breaker: CircuitBreaker = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        # None: bounded only by max_attempts * (timeout + backoff)
+        self.deadline = deadline
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.last_good = {}
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "invalid_responses": 0,
+            "hedged": 0,
+            "short_circuited": 0,
+            "stale_served": 0,
+            "deadline_exhausted": 0,
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform(0, min(cap, base * 2^attempt))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _hedge_delay(self):
+        if not self.hedge_percentile:
+            return None
+        if len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _attempt(self, fn, timeout: float):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        hedge_delay = self._hedge_delay()
+        hedged = hedge_delay is None or hedge_delay >= timeout
+        pending = {asyncio.ensure_future(fn())}
+        error = None
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wait = remaining if hedged else min(remaining, hedge_delay)
+                done, pending = await asyncio.wait(
+                    pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.add(loop.time() - started)
+                        return task.result()
+                    error = task.exception()
+                if not done and not hedged and loop.time() < deadline:
+                    hedged = True
+                    self.counters["hedged"] += 1
+                    pending.add(asyncio.ensure_future(fn()))
+            if error is not None and not pending:
+                raise error
+            raise asyncio.TimeoutError()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, fn, cache_key: str = None):
+        """
+        Run `fn` (a zero-arg coroutine factory) under the resilience policy.
+        On success the result is remembered under `cache_key`; while the
+        breaker is open that result is returned instead of calling upstream.
+        A cached dict comes back as a copy with "stale": True so callers
+        don't store it as fresh data.
+        """
+        self.counters["calls"] += 1
+        if not self.breaker.allow():
+            self.counters["short_circuited"] += 1
+            if cache_key is not None and cache_key in self.last_good:
+                self.counters["stale_served"] += 1
+                cached = self.last_good[cache_key]
+                return {**cached, "stale": True} if isinstance(cached, dict) else cached
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        try:
+            return await self._call(fn, cache_key)
+        finally:
+            # No-op after record_success/record_failure; on cancellation
+            # it stops a half-open breaker from waiting on a dead probe
+            self.breaker.release_probe()
+
+    async def _call(self, fn, cache_key):
+        loop = asyncio.get_running_loop()
+        ends = loop.time() + self.deadline if self.deadline else None
+        for attempt in range(self.max_attempts):
+            timeout = self.timeout
+            if ends is not None:
+                timeout = min(timeout, ends - loop.time())
+            try:
+                result = await self._attempt(fn, timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                elif isinstance(e, InvalidResponseError):
+                    self.counters["invalid_responses"] += 1
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    self.counters["failures"] += 1
+                    self.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt)
+                if ends is not None and ends - loop.time() <= delay:
+                    # No budget left for the backoff, let alone an attempt
+                    self.counters["deadline_exhausted"] += 1
+                    self.counters["failures"] += 1
+                    self.breaker.record_failure()
+                    raise
+                self.counters["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.counters["successes"] += 1
+            self.breaker.record_success()
+            if cache_key is not None:
+                self.last_good[cache_key] = result
+            return result
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        p99 = self.latency.percentile(99)
+        return {
+            "name": self.name,
+            "breaker": self.breaker.snapshot(),
+            "counters": dict(self.counters),
+            "latency_seconds": {
+                "p50": round(p50, 3) if p50 is not None else None,
+                "p95": round(p95, 3) if p95 is not None else None,
+                "p99": round(p99, 3) if p99 is not None else None,
+                "samples": len(self.latency.samples),
+            },
+            "timeout_seconds": self.timeout,
+            "deadline_seconds": self.deadline,
+            "hedge_percentile": self.hedge_percentile,
+            "cached_keys": sorted(self.last_good.keys()),
+        }
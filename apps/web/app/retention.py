@@ -0,0 +1,290 @@
+# app/retention.py
+"""
+Retention for the history tables that grow with every refresh.
+
+One pass (run_retention):
+1. deactivate recommendations whose timeframe has elapsed (is_active)
+2. roll market_analysis up into market_sentiment_daily
+3. move rows older than each table's retention window into its
+   <table>_archive twin, in batches of one DELETE ... RETURNING / INSERT
+4. purge archive rows older than ARCHIVE_TTL_DAYS
+
+Hot tables then only hold the recent window, so their indexes stay small
+and vacuum has little to do. The job runs in at most one worker at a
+time, and once per RETENTION_INTERVAL_HOURS across the cluster: every
+worker polls, the first to find the interval elapsed runs it and the
+rest skip (coordination.run_exclusive).
+"""
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, String, case, delete, func, literal, select
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import coordination
+from app.database import SessionLocal
+
+from .models import (
+    MarketAnalysis,
+    MarketSentimentDaily,
+    NotificationHistory,
+    StockRecommendation,
+    TechnicalIndicator,
+    archive_tables,
+)
+from .recommender import timeframe_days
+
+# Days a row stays in its hot table
+RETENTION_DAYS = {
+    "market_analysis": int(os.getenv("RETENTION_MARKET_ANALYSIS_DAYS", "30")),
+    "technical_indicators": int(os.getenv("RETENTION_TECHNICAL_INDICATORS_DAYS", "90")),
+    "stock_recommendations": int(os.getenv("RETENTION_RECOMMENDATIONS_DAYS", "365")),
+    "notification_history": int(os.getenv("RETENTION_NOTIFICATIONS_DAYS", "180")),
+}
+# Days a row stays in the archive; 0 keeps archives forever
+ARCHIVE_TTL_DAYS = int(os.getenv("ARCHIVE_TTL_DAYS", "1825"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+# 0 disables the in-process schedule (use `python -m app.manage retention`)
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+# How often each worker checks whether a run is due
+RETENTION_POLL_SECONDS = 3600
+
+_r = StockRecommendation
+# Age column per hot table, plus rows that must stay regardless of age
+AGE = {
+    "market_analysis": (MarketAnalysis.analysis_date, None),
+    "technical_indicators": (TechnicalIndicator.analysis_date, None),
+    "stock_recommendations": (
+        func.coalesce(_r.recommendation_date, _r.created_at),
+        _r.is_active.is_not(False),
+    ),
+    "notification_history": (NotificationHistory.sent_at, None),
+}
+MODELS = {
+    "market_analysis": MarketAnalysis,
+    "technical_indicators": TechnicalIndicator,
+    "stock_recommendations": StockRecommendation,
+    "notification_history": NotificationHistory,
+}
+
+
+def deactivate_expired(db, today: date) -> int:
+    """
+    Clear is_active once recommendation_date + timeframe has passed.
+    Labels are parsed in Python (timeframe_days) once per distinct value;
+    a label that doesn't parse gets no horizon and is never expired.
+    """
+    labels = db.execute(
+        select(_r.timeframe).distinct().where(_r.is_active.is_not(False))
+    ).scalars()
+    # Trading-day horizons converted to calendar days
+    horizons = {
+        label: days * 7 // 5
+        for label in labels
+        if (days := timeframe_days(label, default=None)) is not None
+    }
+    if not horizons:
+        return 0
+    horizon = case(horizons, value=_r.timeframe, else_=None)
+    result = db.execute(
+        update(_r)
+        .where(
+            _r.is_active.is_not(False),
+            _r.recommendation_date.is_not(None),
+            _r.recommendation_date + horizon < today,
+        )
+        .values(is_active=False)
+    )
+    return result.rowcount
+
+
+def rollup_sentiment(db, today: date) -> int:
+    """
+    (Re)compute daily sentiment for every complete day still in
+    market_analysis. Days already archived keep their rollup row.
+    """
+    m = MarketAnalysis
+    last_trend = func.array_agg(
+        aggregate_order_by(m.market_trend, m.id.desc()), type_=ARRAY(String)
+    )[1]
+    source = (
+        select(
+            m.analysis_date,
+            func.count(m.id),
+            func.avg(m.bullish_sentiment),
+            func.avg(m.bearish_sentiment),
+            func.avg(m.fear_greed_index),
+            func.min(m.fear_greed_index),
+            func.max(m.fear_greed_index),
+            last_trend,
+            literal(today, Date),
+        )
+        .where(m.analysis_date < today)
+        .group_by(m.analysis_date)
+    )
+    stmt = pg_insert(MarketSentimentDaily).from_select(
+        [
+            "analysis_date",
+            "samples",
+            "bullish_avg",
+            "bearish_avg",
+            "fear_greed_avg",
+            "fear_greed_min",
+            "fear_greed_max",
+            "market_trend",
+            "updated_at",
+        ],
+        source,
+    )
+    result = db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[MarketSentimentDaily.analysis_date],
+            set_={
+                col: stmt.excluded[col]
+                for col in (
+                    "samples",
+                    "bullish_avg",
+                    "bearish_avg",
+                    "fear_greed_avg",
+                    "fear_greed_min",
+                    "fear_greed_max",
+                    "market_trend",
+                    "updated_at",
+                )
+            },
+        )
+    )
+    return result.rowcount
+
+
+def _move_batch(db, name: str, cutoff: date, today: date) -> int:
+    """Move up to one batch of aged rows: WITH moved AS (DELETE ... RETURNING *) INSERT"""
+    table = MODELS[name].__table__
+    archive = archive_tables[name]
+    age, keep = AGE[name]
+    aged = select(table.c.id).where(age < cutoff)
+    if keep is not None:
+        aged = aged.where(~keep)
+    moved = (
+        delete(table)
+        .where(table.c.id.in_(aged.limit(RETENTION_BATCH_SIZE)))
+        .returning(*table.c)
+        .cte("moved")
+    )
+    cols = [c.name for c in table.c]
+    result = db.execute(
+        archive.insert().from_select(
+            cols + ["archived_on"],
+            select(*(moved.c[c] for c in cols), literal(today, Date)),
+        )
+    )
+    return result.rowcount
+
+
+def _purge_batch(db, name: str, cutoff: date) -> int:
+    archive = archive_tables[name]
+    expired = (
+        select(archive.c.id)
+        .where(archive.c.archived_on < cutoff)
+        .limit(RETENTION_BATCH_SIZE)
+    )
+    return db.execute(delete(archive).where(archive.c.id.in_(expired))).rowcount
+
+
+def _drain(db, step) -> int:
+    """Repeat a batch step, one transaction per batch, until it runs dry"""
+    total = 0
+    while True:
+        n = step()
+        db.commit()
+        total += n
+        if n < RETENTION_BATCH_SIZE:
+            return total
+
+
+def run_retention(db, today: Optional[date] = None) -> dict:
+    today = today or date.today()
+    report = {"deactivated": deactivate_expired(db, today)}
+    report["sentiment_days"] = rollup_sentiment(db, today)
+    db.commit()
+
+    report["archived"] = {}
+    for name, days in RETENTION_DAYS.items():
+        if days <= 0:
+            continue
+        cutoff = today - timedelta(days=days)
+        report["archived"][name] = _drain(
+            db, lambda: _move_batch(db, name, cutoff, today)
+        )
+
+    report["purged"] = {}
+    if ARCHIVE_TTL_DAYS > 0:
+        cutoff = today - timedelta(days=ARCHIVE_TTL_DAYS)
+        for name in archive_tables:
+            report["purged"][name] = _drain(db, lambda: _purge_batch(db, name, cutoff))
+
+    for name in MODELS:
+        if report["archived"].get(name) or report["purged"].get(name):
+            coordination.bump_version(db, name)
+    db.commit()
+    return report
+
+
+def retention_job(every: Optional[float] = None) -> bool:
+    """
+    One retention pass in whichever worker gets the lock; False if skipped.
+    With `every` (seconds), also skip if any worker ran it that recently.
+    """
+
+    def run():
+        db = SessionLocal()
+        try:
+            report = run_retention(db)
+            print(f"🧹 Retention: {report}")
+        finally:
+            db.close()
+
+    return coordination.run_exclusive("retention", run, every=every)
+
+
+def _schedule_forever():
+    interval = RETENTION_INTERVAL_HOURS * 3600
+    while True:
+        time.sleep(min(interval, RETENTION_POLL_SECONDS))
+        try:
+            retention_job(every=interval)
+        except Exception as e:
+            print(f"❌ Retention failed: {e}")
+
+
+def start_scheduler():
+    if RETENTION_INTERVAL_HOURS > 0:
+        threading.Thread(
+            target=_schedule_forever, name="retention", daemon=True
+        ).start()
+
+
+def sentiment_history(db, start: Optional[date] = None, end: Optional[date] = None):
+    """Daily sentiment series from the rollup table"""
+    s = MarketSentimentDaily
+    q = select(
+        s.analysis_date,
+        s.samples,
+        s.bullish_avg,
+        s.bearish_avg,
+        s.fear_greed_avg,
+        s.fear_greed_min,
+        s.fear_greed_max,
+        s.market_trend,
+    ).order_by(s.analysis_date)
+    if start:
+        q = q.where(s.analysis_date >= start)
+    if end:
+        q = q.where(s.analysis_date <= end)
+    return [dict(r._mapping) for r in db.execute(q)]
@@ -0,0 +1,288 @@
+# app/sectors.py
+"""
+Sector performance derived from the stock_prices store.
+
+The table is built once per process with a grouped pandas reduction and
+then kept current from price ticks: each tick swaps one ticker's
+contribution out of its sector's running sums, so no rescans are needed.
+
+Sector return is the market-cap weighted day return (weights at the
+previous close), like an index.
+"""
+
+import threading
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from .models import Stock, StockPrice
+
+# Stock.market_cap is in rupees; sectors are reported in lakh crore
+MARKET_CAP_UNIT = 1e12
+
+
+class SectorAggregator:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.as_of: Optional[date] = None
+        # ticker -> {sector, base_cap, base_price, prev, last, last_date}
+        self.tickers: Dict[str, dict] = {}
+        # sector -> running sums
+        self.sectors: Dict[str, dict] = {}
+
+    # --- per-ticker contribution ---
+
+    @staticmethod
+    def _contribution(t: dict) -> tuple:
+        """(prev-close cap weight, weighted return, current cap, return, counted)"""
+        prev, last = t["prev"], t["last"]
+        if not prev or last is None:
+            return 0.0, 0.0, 0.0, 0.0, 0
+        ret = last / prev - 1
+        scale = t["base_cap"] / t["base_price"] if t["base_price"] else 0.0
+        weight = scale * prev
+        return weight, weight * ret, scale * last, ret, 1
+
+    def _apply(self, t: dict, sign: int):
+        s = self.sectors.setdefault(
+            t["sector"],
+            {"weight": 0.0, "weighted_ret": 0.0, "cap": 0.0, "ret_sum": 0.0, "n": 0},
+        )
+        weight, weighted_ret, cap, ret, counted = self._contribution(t)
+        s["weight"] += sign * weight
+        s["weighted_ret"] += sign * weighted_ret
+        s["cap"] += sign * cap
+        s["ret_sum"] += sign * ret
+        s["n"] += sign * counted
+
+    # --- full build ---
+
+    def load(self, db):
+        """Build sector sums from the last two closes of every ticker"""
+        import pandas as pd  # deferred: only needed for the initial build
+
+        ranked = select(
+            StockPrice.ticker,
+            StockPrice.price_date,
+            StockPrice.close,
+            func.row_number()
+            .over(partition_by=StockPrice.ticker, order_by=StockPrice.price_date.desc())
+            .label("rn"),
+        ).subquery()
+        prices = pd.DataFrame(
+            db.execute(
+                select(
+                    ranked.c.ticker, ranked.c.price_date, ranked.c.close, ranked.c.rn
+                ).where(ranked.c.rn <= 2)
+            ).all(),
+            columns=["ticker", "price_date", "close", "rn"],
+        )
+        meta = pd.DataFrame(
+            db.execute(
+                select(
+                    Stock.ticker, Stock.sector, Stock.market_cap, Stock.current_price
+                )
+                .distinct(Stock.ticker)
+                .order_by(Stock.ticker, Stock.last_updated.desc())
+            ).all(),
+            columns=["ticker", "sector", "market_cap", "current_price"],
+        )
+
+        latest = prices[prices["rn"] == 1].set_index("ticker")
+        previous = prices[prices["rn"] == 2].set_index("ticker")
+        df = meta.set_index("ticker")
+        df["sector"] = df["sector"].fillna("Unknown").str.strip()
+        df["last"] = latest["close"].reindex(df.index).fillna(df["current_price"])
+        df["last_date"] = latest["price_date"].reindex(df.index)
+        df["prev"] = previous["close"].reindex(df.index)
+        df["base_cap"] = df["market_cap"].fillna(0.0)
+        df["base_price"] = df["current_price"].fillna(df["last"])
+
+        # Grouped reduction for the initial table
+        ret = df["last"] / df["prev"] - 1
+        scale = (
+            (df["base_cap"] / df["base_price"]).replace([np.inf, -np.inf], 0).fillna(0)
+        )
+        valid = ret.notna()
+        frame = pd.DataFrame(
+            {
+                "sector": df["sector"],
+                "weight": np.where(valid, scale * df["prev"], 0.0),
+                "weighted_ret": np.where(valid, scale * df["prev"] * ret, 0.0),
+                "cap": np.where(valid, scale * df["last"], 0.0),
+                "ret_sum": ret.where(valid, 0.0),
+                "n": valid.astype(int),
+            }
+        )
+        sums = frame.groupby("sector").sum()
+
+        with self.lock:
+            self.tickers = {
+                row.Index: {
+                    "sector": row.sector,
+                    "base_cap": float(row.base_cap),
+                    "base_price": (
+                        float(row.base_price) if pd.notna(row.base_price) else 0.0
+                    ),
+                    "prev": float(row.prev) if pd.notna(row.prev) else None,
+                    "last": float(row.last) if pd.notna(row.last) else None,
+                    "last_date": row.last_date if pd.notna(row.last_date) else None,
+                }
+                for row in df.itertuples()
+            }
+            self.sectors = {
+                sector: {k: float(v) for k, v in vals.items()}
+                for sector, vals in sums.to_dict("index").items()
+            }
+            dates = [t["last_date"] for t in self.tickers.values() if t["last_date"]]
+            self.as_of = max(dates) if dates else None
+            self.loaded = True
+
+    def invalidate(self):
+        """Drop the table; the next ensure_loaded() rebuilds it"""
+        with self.lock:
+            self.loaded = False
+
+    def ensure_loaded(self, db):
+        if not self.loaded:
+            self.load(db)
+
+    # --- incremental updates ---
+
+    def add_tickers(self, db, tickers):
+        """
+        Pick up holdings written after load(): their sector, market cap and
+        last two closes, read for just those tickers. Known tickers are
+        left alone; before the first load there is nothing to add to.
+        """
+        with self.lock:
+            if not self.loaded:
+                return
+            new = sorted(set(tickers) - set(self.tickers))
+        if not new:
+            return
+        meta = db.execute(
+            select(Stock.ticker, Stock.sector, Stock.market_cap, Stock.current_price)
+            .where(Stock.ticker.in_(new))
+            .distinct(Stock.ticker)
+            .order_by(Stock.ticker, Stock.last_updated.desc())
+        ).all()
+        ranked = (
+            select(
+                StockPrice.ticker,
+                StockPrice.price_date,
+                StockPrice.close,
+                func.row_number()
+                .over(
+                    partition_by=StockPrice.ticker,
+                    order_by=StockPrice.price_date.desc(),
+                )
+                .label("rn"),
+            )
+            .where(StockPrice.ticker.in_(new))
+            .subquery()
+        )
+        closes: Dict[str, list] = {}
+        for r in db.execute(
+            select(ranked.c.ticker, ranked.c.price_date, ranked.c.close)
+            .where(ranked.c.rn <= 2)
+            .order_by(ranked.c.ticker, ranked.c.rn)
+        ):
+            closes.setdefault(r.ticker, []).append((r.price_date, r.close))
+
+        with self.lock:
+            for r in meta:
+                if r.ticker in self.tickers:
+                    continue
+                history = closes.get(r.ticker, [])
+                # Same fallbacks as load()
+                last_date, last = history[0] if history else (None, r.current_price)
+                base_price = r.current_price if r.current_price is not None else last
+                t = {
+                    "sector": (r.sector or "Unknown").strip(),
+                    "base_cap": float(r.market_cap or 0.0),
+                    "base_price": float(base_price) if base_price is not None else 0.0,
+                    "prev": float(history[1][1]) if len(history) > 1 else None,
+                    "last": float(last) if last is not None else None,
+                    "last_date": last_date,
+                }
+                self.tickers[r.ticker] = t
+                self._apply(t, +1)
+                if last_date and (self.as_of is None or last_date > self.as_of):
+                    self.as_of = last_date
+
+    def on_holdings_added(self, db, data: dict):
+        """Another worker wrote holdings; add them, or rebuild if not listed"""
+        tickers = data.get("tickers")
+        if tickers is None:
+            self.invalidate()
+        else:
+            self.add_tickers(db, tickers)
+
+    def on_tick(self, ticker: str, price: float, price_date: date):
+        """Update one ticker; O(1) regardless of universe size"""
+        with self.lock:
+            t = self.tickers.get(ticker)
+            if t is None:
+                # Not a holding: no sector or market cap to attribute (new
+                # holdings are registered through add_tickers)
+                return
+            self._apply(t, -1)
+            if t["last_date"] is not None and price_date > t["last_date"]:
+                t["prev"] = t["last"]
+            t["last"] = price
+            t["last_date"] = price_date
+            if not t["base_price"]:
+                t["base_price"] = price
+            self._apply(t, +1)
+            if self.as_of is None or price_date > self.as_of:
+                self.as_of = price_date
+
+    def apply_ticks(self, prices: Dict[str, float], price_date: date):
+        for ticker, price in prices.items():
+            self.on_tick(ticker, price, price_date)
+
+    def on_prices_updated(self, data: dict):
+        """
+        Another worker's refresh: apply the ticks it broadcast, or drop the
+        table when they didn't fit in the notification.
+        """
+        prices, day = data.get("prices"), data.get("date")
+        if prices is None or day is None:
+            self.invalidate()
+        elif self.loaded:
+            self.apply_ticks(prices, date.fromisoformat(day))
+
+    def snapshot(self) -> list:
+        """Sector rows in the same shape the analysis endpoint returns"""
+        out = []
+        with self.lock:
+            total_cap = sum(s["cap"] for s in self.sectors.values())
+            for sector, s in sorted(self.sectors.items()):
+                if s["n"] <= 0:
+                    continue
+                if s["weight"] > 0:
+                    perf = s["weighted_ret"] / s["weight"] * 100
+                else:
+                    perf = s["ret_sum"] / s["n"] * 100
+                out.append(
+                    {
+                        "name": sector,
+                        "performance": f"{perf:.2f}",
+                        "trend": "positive" if perf >= 0 else "negative",
+                        "market_cap": f"{s['cap'] / MARKET_CAP_UNIT:.2f}",
+                        "weight_percent": (
+                            round(s["cap"] / total_cap * 100, 2) if total_cap else None
+                        ),
+                        "constituents": int(s["n"]),
+                        "analysis_date": self.as_of.isoformat() if self.as_of else None,
+                    }
+                )
+        out.sort(key=lambda r: float(r["performance"]), reverse=True)
+        return out
+
+
+sector_aggregator = SectorAggregator()
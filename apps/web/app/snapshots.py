@@ -0,0 +1,115 @@
+# app/snapshots.py
+"""
+Portfolio NAV snapshots.
+
+Each market refresh copies portfolio_summary into day, week and month
+rows with set-based upserts (open kept, high/low/close folded in), so
+history charts read pre-aggregated rows and never replay holdings.
+"""
+
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import PortfolioSnapshot, PortfolioSummary
+
+PERIODS = ("day", "week", "month")
+
+
+def period_start(period: str, as_of: date) -> date:
+    if period == "week":
+        return as_of - timedelta(days=as_of.weekday())
+    if period == "month":
+        return as_of.replace(day=1)
+    return as_of
+
+
+def record_snapshots(db, as_of: Optional[date] = None):
+    """One INSERT ... SELECT per period over all users' summary rows"""
+    as_of = as_of or date.today()
+    nav = PortfolioSummary.current_value
+    for period in PERIODS:
+        source = select(
+            PortfolioSummary.user_id,
+            literal(period),
+            literal(period_start(period, as_of)),
+            nav,
+            nav,
+            nav,
+            nav,
+            PortfolioSummary.invested,
+            PortfolioSummary.change_value,
+            literal(1),
+            literal(as_of),
+        )
+        stmt = pg_insert(PortfolioSnapshot).from_select(
+            [
+                "user_id",
+                "period",
+                "period_start",
+                "open_value",
+                "high_value",
+                "low_value",
+                "close_value",
+                "invested",
+                "change_value",
+                "samples",
+                "updated_at",
+            ],
+            source,
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                constraint="uq_portfolio_snapshots_period",
+                set_={
+                    "high_value": func.greatest(
+                        PortfolioSnapshot.high_value, stmt.excluded.close_value
+                    ),
+                    "low_value": func.least(
+                        PortfolioSnapshot.low_value, stmt.excluded.close_value
+                    ),
+                    "close_value": stmt.excluded.close_value,
+                    "invested": stmt.excluded.invested,
+                    "change_value": stmt.excluded.change_value,
+                    "samples": PortfolioSnapshot.samples + 1,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+
+
+def nav_history(
+    db,
+    user_id: str,
+    period: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> list:
+    """Range read over the (user_id, period, period_start) unique index"""
+    q = select(
+        PortfolioSnapshot.period_start,
+        PortfolioSnapshot.open_value,
+        PortfolioSnapshot.high_value,
+        PortfolioSnapshot.low_value,
+        PortfolioSnapshot.close_value,
+        PortfolioSnapshot.invested,
+        PortfolioSnapshot.change_value,
+    ).where(PortfolioSnapshot.user_id == user_id, PortfolioSnapshot.period == period)
+    if start:
+        q = q.where(PortfolioSnapshot.period_start >= period_start(period, start))
+    if end:
+        q = q.where(PortfolioSnapshot.period_start <= end)
+    return [
+        {
+            "date": r.period_start.isoformat(),
+            "open": round(r.open_value or 0, 2),
+            "high": round(r.high_value or 0, 2),
+            "low": round(r.low_value or 0, 2),
+            "nav": round(r.close_value or 0, 2),
+            "invested": round(r.invested or 0, 2),
+            "change_value": round(r.change_value or 0, 2),
+        }
+        for r in db.execute(q.order_by(PortfolioSnapshot.period_start))
+    ]
@@ -0,0 +1,161 @@
+# benchmarks/serialization.py
+"""
+Per-request CPU time of the read endpoints: the previous ORM-entity +
+hand-built dict path against the column-only query + declared response
+model path now in app.main.
+
+Runs against an in-memory SQLite database, so no Postgres is needed:
+
+    cd apps/web && python -m benchmarks.serialization [--rows 5000] [--requests 50]
+"""
+
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+# app.database builds a (never used) Postgres engine at import time
+for var, default in (("POSTGRES_PORT", "5432"), ("POSTGRES_HOST", "localhost")):
+    os.environ.setdefault(var, default)
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, get_db
+from app.main import app
+from app.models import NiftyIndex, StockRecommendation
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+Session = sessionmaker(bind=engine)
+
+
+def _db():
+    db = Session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# --- previous implementation, kept here as the baseline ---
+legacy = FastAPI()
+
+
+@legacy.get("/api/stocks/nifty-indices")
+def legacy_nifty_indices(db=Depends(_db)):
+    out = []
+    for r in db.query(NiftyIndex).all():
+        out.append(
+            {
+                "name": r.name,
+                "current_value": r.current_value,
+                "change_value": r.change_value,
+                "change_percent": r.change_percent,
+                "is_positive": True if r.change_value >= 0 else False,
+            }
+        )
+    return {"data": out}
+
+
+@legacy.get("/api/stocks/recommendations")
+def legacy_recommendations(limit: int = 20, db=Depends(_db)):
+    rows = (
+        db.query(StockRecommendation)
+        .order_by(StockRecommendation.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+    out = []
+    for r in rows:
+        out.append(
+            {
+                "id": r.id,
+                "ticker": r.ticker,
+                "company_name": r.company_name,
+                "sector": r.sector,
+                "current_price": r.current_price,
+                "target_price": r.target_price,
+                "recommendation": r.recommendation,
+                "confidence_score": r.confidence_score,
+                "timeframe": r.timeframe,
+                "reasons": r.reasons,
+                "alert_time": r.alert_time,
+            }
+        )
+    return {"data": out}
+
+
+def seed(rows: int):
+    Base.metadata.create_all(engine)
+    today = date.today()
+    with Session() as db:
+        db.add_all(
+            NiftyIndex(
+                name=f"NIFTY {i}",
+                current_value=20000 + i,
+                change_value=(-1) ** i * i / 10,
+                change_percent=(-1) ** i * 0.5,
+                last_updated=today,
+            )
+            for i in range(rows // 10)
+        )
+        db.add_all(
+            StockRecommendation(
+                ticker=f"TICK{i % 500}",
+                company_name=f"Company {i % 500} Ltd",
+                sector=("IT", "Banking", "Energy", "FMCG")[i % 4],
+                current_price=100 + i % 900,
+                target_price=110 + i % 900,
+                recommendation=("BUY", "SELL", "HOLD")[i % 3],
+                confidence_score=0.5 + (i % 50) / 100,
+                timeframe="1-2 weeks",
+                reasons="Momentum and volume breakout above the 50-day average",
+                alert_time=("10_AM", "2_PM")[i % 2],
+                recommendation_date=today - timedelta(days=i % 30),
+                created_at=today - timedelta(days=i % 30),
+            )
+            for i in range(rows)
+        )
+        db.commit()
+
+
+def cpu_per_request(client: TestClient, url: str, requests: int) -> float:
+    body = client.get(url).json()  # warm-up, and a sanity check
+    assert body["data"], url
+    start = time.process_time()
+    for _ in range(requests):
+        client.get(url)
+    return (time.process_time() - start) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    app.dependency_overrides[get_db] = _db
+    old, new = TestClient(legacy), TestClient(app)
+
+    urls = [
+        "/api/stocks/nifty-indices",
+        f"/api/stocks/recommendations?limit={args.rows}",
+    ]
+    for url in urls:
+        assert old.get(url).json() == new.get(url).json(), f"payload differs: {url}"
+
+    print(f"{'endpoint':<50} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for url in urls:
+        before = cpu_per_request(old, url, args.requests)
+        after = cpu_per_request(new, url, args.requests)
+        print(f"{url:<50} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()